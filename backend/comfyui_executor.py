@@ -40,6 +40,7 @@ class ComfyUIExecutor:
         self.process: Optional[subprocess.Popen] = None
         self._workflow_cache = None
         self._node_info_cache = {}  # Cache for node widget info from API
+        self._running_probe = (0.0, False)  # (monotonic time, result) of the last probe
     
     def get_node_info(self, node_type: str) -> Optional[Dict]:
         """Get node info from ComfyUI API, with caching"""
@@ -59,13 +60,24 @@ class ComfyUIExecutor:
         return None
 
     
-    def is_server_running(self) -> bool:
-        """Check if ComfyUI server is already running"""
+    def is_server_running(self, max_age: float = 0.0) -> bool:
+        """
+        Check if ComfyUI server is already running
+        
+        Args:
+            max_age: Reuse the last probe if it is at most this many seconds
+                     old (for polled status routes); 0 always probes
+        """
+        checked_at, running = self._running_probe
+        if max_age > 0 and time.monotonic() - checked_at <= max_age:
+            return running
         try:
             response = requests.get(f"{COMFYUI_URL}/system_stats", timeout=2)
-            return response.status_code == 200
+            running = response.status_code == 200
         except:
-            return False
+            running = False
+        self._running_probe = (time.monotonic(), running)
+        return running
     
     def start_server(self, timeout: int = 120) -> bool:
         """Start ComfyUI server as subprocess"""
@@ -198,7 +210,7 @@ class ComfyUIExecutor:
         try:
             # Convert to bytes
             img_bytes = io.BytesIO()
-            image.save(img_bytes, format='PNG')
+            image.save(img_bytes, format='PNG', compress_level=1)  # local upload: encode speed over size
             img_bytes.seek(0)
             
             files = {
@@ -722,7 +734,8 @@ class ComfyUIExecutor:
                                 # Convert to JPEG base64
                                 buffer = io.BytesIO()
                                 preview_img.save(buffer, format='JPEG', quality=75)
-                                preview_b64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+                                with buffer.getbuffer() as jpeg:
+                                    preview_b64 = base64.b64encode(jpeg).decode('ascii')
                                 
                                 preview_callback(preview_b64, current_step)
                                 logging.debug(f"Preview sent: step {current_step}")
@@ -1105,12 +1118,15 @@ class ComfyUIExecutor:
 
 # Global executor instance
 _executor: Optional[ComfyUIExecutor] = None
+_executor_lock = threading.Lock()
 
 def get_executor() -> ComfyUIExecutor:
     """Get or create global executor"""
     global _executor
     if _executor is None:
-        _executor = ComfyUIExecutor()
+        with _executor_lock:
+            if _executor is None:
+                _executor = ComfyUIExecutor()
     return _executor
 
 
@@ -5,12 +5,16 @@ Handles upscaling with GPU/CPU auto-detection and progress tracking
 
 import os
 import io
-import base64
+import contextlib
+try:
+    import pybase64 as base64  # Optional drop-in, SIMD accelerated
+except ImportError:
+    import base64
 import torch
 import numpy as np
 from PIL import Image
 from pathlib import Path
-from typing import Optional, Tuple, Callable
+from typing import Optional, Tuple, Callable, List
 
 # PATCH: Fix for newer torchvision versions breaking basicsr
 try:
@@ -27,8 +31,13 @@ except ImportError:
 from basicsr.archs.rrdbnet_arch import RRDBNet
 from realesrgan import RealESRGANer
 
+from engines.torch_utils import maybe_compile
+
 
 class ESRGANEngine:
+    # Largest input side upscale_batch() takes: one untiled pass, like a CUDA tile
+    BATCH_MAX_SIDE = 512
+    
     def __init__(self, model_path: str, device: Optional[str] = None):
         """
         Initialize ESRGAN upscaler
@@ -101,6 +110,18 @@ class ESRGANEngine:
                     self.upsampler.model = self.upsampler.model.to('cuda')
                     self.upsampler.device = torch.device('cuda')
         
+        maybe_compile(self.upsampler.model, self.device, "ESRGAN")
+        
+        # Dedicated high-priority stream so ESRGAN work isn't queued behind
+        # other engines' kernels on the default stream
+        self.stream = torch.cuda.Stream(priority=-1) if self.device == 'cuda' else None
+        
+        # Pinned staging buffers + streams for upscale_pipelined, allocated on
+        # first use and reused across requests (cudaHostAlloc is slow)
+        self._pinned_in = None
+        self._pinned_out = None
+        self._tile_streams = None
+        
         print(f"[OK] ESRGAN Engine ready!")
         print(f"[Info] Using tile size: {tile_size}x{tile_size}")
         if self.device == 'cuda':
@@ -112,10 +133,15 @@ class ESRGANEngine:
         scale_factor: int = 4,
         outscale: Optional[float] = None,
         use_tiling: bool = True,
-        progress_callback: Optional[Callable[[int], None]] = None
+        progress_callback: Optional[Callable[[int], None]] = None,
+        use_pipelined: bool = True
     ) -> Image.Image:
         """
         Upscale a PIL Image with optional progress tracking
+        
+        Args:
+            use_pipelined: On CUDA with tiling, overlap tile copies with compute
+                           (see upscale_pipelined); falls back to RealESRGANer tiling
         """
         # Configure tiling
         if use_tiling:
@@ -139,13 +165,32 @@ class ESRGANEngine:
         if progress_callback:
             progress_callback(10)  # Starting
         
+        # If scale_factor is 2, we'll use outscale=2 to downsample 4x result
+        if scale_factor == 2:
+            outscale = 2.0
+        
         # Perform upscaling
         try:
-            # If scale_factor is 2, we'll use outscale=2 to downsample 4x result
-            if scale_factor == 2:
-                output, _ = self.upsampler.enhance(img_array, outscale=2.0)
-            else:
-                output, _ = self.upsampler.enhance(img_array, outscale=outscale)
+            output = None
+            if use_tiling and use_pipelined and self.device == 'cuda':
+                try:
+                    output = self.upscale_pipelined(img_array, progress_callback)
+                except RuntimeError as e:
+                    print(f"[WARN] Pipelined tiling failed: {e}")
+                    print("[INFO] Falling back to RealESRGANer tiling...")
+                    output = None
+                
+                if output is not None and outscale is not None and outscale != 4:
+                    h, w = img_array.shape[:2]
+                    output = np.array(
+                        Image.fromarray(output).resize(
+                            (int(w * outscale), int(h * outscale)), Image.LANCZOS
+                        )
+                    )
+            
+            if output is None:
+                with self._stream_context():
+                    output, _ = self.upsampler.enhance(img_array, outscale=outscale)
             
             if progress_callback:
                 progress_callback(90)  # Processing complete
@@ -162,6 +207,158 @@ class ESRGANEngine:
             print(f"Upscale error: {e}")
             raise
     
+    def upscale_batch(self, images: List[Image.Image], scale_factor: int = 4) -> List[Image.Image]:
+        """
+        Upscale same-sized images in one forward pass (no tiling)
+        
+        A single small image leaves most of the GPU idle; stacking concurrent
+        requests into one batch runs them for roughly the cost of one.
+        Inputs should be no larger than BATCH_MAX_SIDE (one CUDA tile).
+        If the batch doesn't fit in VRAM, the images are upscaled one at a
+        time (tiled) so one OOM doesn't fail every request in it.
+        """
+        arrays = [np.asarray(image.convert('RGB')) for image in images]
+        h, w = arrays[0].shape[:2]
+        dtype = torch.float16 if self.upsampler.half else torch.float32
+        
+        try:
+            with torch.no_grad(), self._stream_context():
+                x = torch.from_numpy(np.stack(arrays)).to(self.device)
+                x = x.permute(0, 3, 1, 2).to(dtype).div_(255.0)
+                y = self.upsampler.model(x)
+                y = y.clamp_(0, 1).mul_(255.0).round_().to(torch.uint8)
+                outputs = y.permute(0, 2, 3, 1).cpu().numpy()
+        except torch.cuda.OutOfMemoryError:
+            x = y = None
+            torch.cuda.empty_cache()
+            print(f"[WARN] Out of memory on a batch of {len(images)}, upscaling one at a time")
+            return [self.upscale_image(image, scale_factor) for image in images]
+        
+        results = [Image.fromarray(output) for output in outputs]
+        if scale_factor == 2:
+            results = [result.resize((w * 2, h * 2), Image.LANCZOS) for result in results]
+        return results
+    
+    def _stream_context(self):
+        """Run on this engine's CUDA stream, ordered after prior default-stream work"""
+        if self.stream is None:
+            return contextlib.nullcontext()
+        self.stream.wait_stream(torch.cuda.current_stream())
+        return torch.cuda.stream(self.stream)
+    
+    def warmup(self, size: int = 64):
+        """
+        Run one dummy forward pass so CUDA kernel loading and cuDNN
+        autotuning happen before the first real request
+        """
+        if self.device != 'cuda':
+            return
+        
+        dtype = torch.float16 if self.upsampler.half else torch.float32
+        with torch.no_grad():
+            dummy = torch.zeros(1, 3, size, size, device=self.device, dtype=dtype)
+            self.upsampler.model(dummy)
+        torch.cuda.synchronize()
+    
+    def _get_staging_buffers(self, in_numel: int, scale: int):
+        """Return the two pinned (input, output) slot buffers, growing them if too small"""
+        if self._pinned_in is None or self._pinned_in[0].numel() < in_numel:
+            self._pinned_in = [torch.empty(in_numel, dtype=torch.uint8).pin_memory() for _ in range(2)]
+            self._pinned_out = [
+                torch.empty(in_numel * scale * scale, dtype=torch.uint8).pin_memory() for _ in range(2)
+            ]
+        return self._pinned_in, self._pinned_out
+    
+    def upscale_pipelined(
+        self,
+        img_array: np.ndarray,
+        progress_callback: Optional[Callable[[int], None]] = None
+    ) -> np.ndarray:
+        """
+        Tiled 4x upscale with PCIe copies overlapped with compute (CUDA only)
+        
+        Tiles alternate between two CUDA streams, each with its own pinned
+        staging buffers, so the upload of tile k+1 and the download of
+        tile k-1 run while tile k is computing.
+        
+        Args:
+            img_array: HxWx3 uint8 RGB array
+            
+        Returns:
+            (4H)x(4W)x3 uint8 RGB array
+        """
+        scale = 4
+        tile = self.upsampler.tile_size
+        pad = self.upsampler.tile_pad
+        model = self.upsampler.model
+        dtype = torch.float16 if self.upsampler.half else torch.float32
+        device = torch.device(self.device)
+        
+        h, w = img_array.shape[:2]
+        src = torch.from_numpy(np.ascontiguousarray(img_array)).permute(2, 0, 1)  # CHW view
+        output = np.empty((h * scale, w * scale, 3), dtype=np.uint8)
+        
+        tiles = [
+            (y0, min(y0 + tile, h), x0, min(x0 + tile, w))
+            for y0 in range(0, h, tile)
+            for x0 in range(0, w, tile)
+        ]
+        
+        # Per-slot pinned staging buffers, sized for the largest padded tile
+        in_bufs, out_bufs = self._get_staging_buffers(3 * (tile + 2 * pad) ** 2, scale)
+        if self._tile_streams is None:
+            self._tile_streams = [torch.cuda.Stream(device=device) for _ in range(2)]
+        streams = self._tile_streams
+        pending = [None, None]  # (done_event, staged_output, placement) per slot
+        
+        def flush(slot):
+            # Wait for the slot's D2H copy, then place the tile without its padding
+            done, staged, (oy0, oy1, ox0, ox1, cy0, cx0) = pending[slot]
+            done.synchronize()
+            crop = staged[:, cy0:cy0 + (oy1 - oy0), cx0:cx0 + (ox1 - ox0)]
+            output[oy0:oy1, ox0:ox1] = crop.permute(1, 2, 0).numpy()
+            pending[slot] = None
+        
+        with torch.no_grad():
+            for i, (y0, y1, x0, x1) in enumerate(tiles):
+                slot = i % 2
+                if pending[slot] is not None:
+                    flush(slot)  # Staging buffers of this slot are free again
+                
+                # Padded input region
+                py0, py1 = max(y0 - pad, 0), min(y1 + pad, h)
+                px0, px1 = max(x0 - pad, 0), min(x1 + pad, w)
+                ih, iw = py1 - py0, px1 - px0
+                
+                staged_in = in_bufs[slot][:3 * ih * iw].view(3, ih, iw)
+                staged_in.copy_(src[:, py0:py1, px0:px1])
+                staged_out = out_bufs[slot][:3 * ih * iw * scale * scale].view(3, ih * scale, iw * scale)
+                
+                stream = streams[slot]
+                with torch.cuda.stream(stream):
+                    x = staged_in.to(device, non_blocking=True)
+                    x = x.unsqueeze(0).to(dtype).div_(255.0)
+                    y = model(x)
+                    y = y.squeeze(0).clamp_(0, 1).mul_(255.0).round_().to(torch.uint8)
+                    staged_out.copy_(y, non_blocking=True)
+                    done = torch.cuda.Event()
+                    done.record(stream)
+                
+                placement = (
+                    y0 * scale, y1 * scale, x0 * scale, x1 * scale,
+                    (y0 - py0) * scale, (x0 - px0) * scale
+                )
+                pending[slot] = (done, staged_out, placement)
+                
+                if progress_callback:
+                    progress_callback(10 + int((i + 1) / len(tiles) * 80))
+            
+            for slot in range(2):
+                if pending[slot] is not None:
+                    flush(slot)
+        
+        return output
+    
     def upscale_from_base64(
         self, 
         base64_image: str, 
@@ -179,8 +376,66 @@ class ESRGANEngine:
         image_data = base64.b64decode(base64_image)
         input_image = Image.open(io.BytesIO(image_data))
         
+        result_base64, _, _ = self.upscale_from_pil(
+            input_image,
+            scale_factor,
+            use_tiling=use_tiling,
+            progress_callback=progress_callback
+        )
+        
+        return result_base64
+    
+    def upscale_from_pil(
+        self,
+        input_image: Image.Image,
+        scale_factor: int = 4,
+        use_tiling: bool = True,
+        progress_callback: Optional[Callable[[int], None]] = None
+    ) -> Tuple[str, int, int]:
+        """
+        Upscale an already decoded PIL Image (skips the base64 decode)
+        
+        Returns:
+            (base64_png, width, height) of the upscaled image
+        """
+        png_bytes, width, height = self.upscale_to_png_bytes(
+            input_image,
+            scale_factor,
+            use_tiling=use_tiling,
+            progress_callback=progress_callback
+        )
+        return base64.b64encode(png_bytes).decode('utf-8'), width, height
+    
+    def upscale_to_pil(
+        self,
+        input_image: Image.Image,
+        scale_factor: int = 4,
+        use_tiling: bool = True,
+        progress_callback: Optional[Callable[[int], None]] = None
+    ) -> Image.Image:
+        """Upscale a PIL Image without encoding the result (same arguments as upscale_to_png_bytes)"""
+        return self.upscale_image(
+            input_image,
+            scale_factor,
+            use_tiling=use_tiling,
+            progress_callback=progress_callback
+        )
+    
+    def upscale_to_png_bytes(
+        self,
+        input_image: Image.Image,
+        scale_factor: int = 4,
+        use_tiling: bool = True,
+        progress_callback: Optional[Callable[[int], None]] = None
+    ) -> Tuple[bytes, int, int]:
+        """
+        Upscale a PIL Image and return raw PNG bytes (no base64 encode)
+        
+        Returns:
+            (png_bytes, width, height) of the upscaled image
+        """
         # Upscale
-        output_image = self.upscale_image(
+        output_image = self.upscale_to_pil(
             input_image, 
             scale_factor, 
             use_tiling=use_tiling,
@@ -192,14 +447,12 @@ class ESRGANEngine:
             progress_callback(95)  # Encoding
         
         buffer = io.BytesIO()
-        output_image.save(buffer, format='PNG')
-        buffer.seek(0)
-        result_base64 = base64.b64encode(buffer.read()).decode('utf-8')
+        output_image.save(buffer, format='PNG', compress_level=1)
         
         if progress_callback:
             progress_callback(100)  # Complete
         
-        return result_base64
+        return buffer.getvalue(), output_image.width, output_image.height
     
     def get_output_dimensions(self, width: int, height: int, scale: int) -> Tuple[int, int]:
         """Calculate output dimensions"""
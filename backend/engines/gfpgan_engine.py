@@ -162,7 +162,7 @@ class GFPGANEngine:
             
             # Encode
             buffer = io.BytesIO()
-            result.save(buffer, format='PNG')
+            result.save(buffer, format='PNG', compress_level=1)
             return base64.b64encode(buffer.getvalue()).decode()
             
         except Exception as e:
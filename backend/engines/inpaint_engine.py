@@ -7,7 +7,7 @@ import gc
 import base64
 import io
 from pathlib import Path
-from typing import Optional, Callable
+from typing import Optional, Callable, Tuple
 import torch
 from PIL import Image
 import numpy as np
@@ -137,12 +137,12 @@ class InpaintEngine:
         prompt: str,
         strength: float = 0.75,
         progress_callback: Optional[Callable[[int, int], None]] = None
-    ) -> str:
+    ) -> Tuple[str, int, int]:
         """
         Inpaint from base64 encoded images
         
         Returns:
-            Result image as base64 PNG
+            (base64_png, width, height) of the result image
         """
         # Decode image
         img_data = base64.b64decode(image_b64)
@@ -169,8 +169,8 @@ class InpaintEngine:
         
         # Encode result
         buffer = io.BytesIO()
-        result.save(buffer, format='PNG')
-        return base64.b64encode(buffer.getvalue()).decode()
+        result.save(buffer, format='PNG', compress_level=1)
+        return base64.b64encode(buffer.getvalue()).decode(), result.width, result.height
     
     def unload(self):
         """Unload pipeline to free VRAM"""
@@ -171,7 +171,7 @@ class QwenImageEditEngine:
         
         # Encode output
         buffer = io.BytesIO()
-        result.save(buffer, format='PNG')
+        result.save(buffer, format='PNG', compress_level=1)
         return base64.b64encode(buffer.getvalue()).decode()
     
     def unload(self):
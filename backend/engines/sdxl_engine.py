@@ -6,18 +6,24 @@ Includes HiresFix and Skin Texture enhancement modules
 
 import os
 import io
-import base64
+import contextlib
+try:
+    import pybase64 as base64  # Optional drop-in, SIMD accelerated
+except ImportError:
+    import base64
 import torch
 import numpy as np
 from PIL import Image
 from pathlib import Path
-from typing import Optional, Dict, Tuple, Callable
+from typing import Optional, Dict, Tuple, Callable, Union
 from diffusers import (
     StableDiffusionXLImg2ImgPipeline,
     DPMSolverMultistepScheduler,
     AutoencoderKL
 )
 
+from engines.torch_utils import maybe_compile
+
 
 class SDXLEngine:
     def __init__(self, model_path: str, device: Optional[str] = None):
@@ -74,6 +80,14 @@ class SDXLEngine:
             except Exception as e:
                 print(f"[!] xformers not available: {e}")
         
+        # UNet and VAE decoder compiled separately (the text encoders run once per call)
+        maybe_compile(self.pipeline.unet, self.device, "SDXL UNet")
+        maybe_compile(self.pipeline.vae.decoder, self.device, "SDXL VAE decoder")
+        
+        # Own CUDA stream, so SDXL kernels don't serialize behind other engines
+        # on the default stream
+        self.stream = torch.cuda.Stream(priority=-1) if self.device == 'cuda' else None
+        
         print(f"[OK] SDXL Engine ready!")
     
     def _build_prompt(
@@ -207,7 +221,9 @@ class SDXLEngine:
                         # Convert to base64
                         buffer = io.BytesIO()
                         preview_img.save(buffer, format='JPEG', quality=70)
-                        preview_b64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+                        # Encode from the BytesIO's own buffer (no getvalue() copy)
+                        with buffer.getbuffer() as jpeg:
+                            preview_b64 = base64.b64encode(jpeg).decode('ascii')
                         
                         preview_callback(preview_b64, step_num)
             except Exception as e:
@@ -295,21 +311,38 @@ class SDXLEngine:
             
             return result
 
-        try:
-            # Try with requested tiling setting
-            result = run_inference(use_tiling)
-        except RuntimeError as e:
-            if "cannot reshape tensor" in str(e) and use_tiling:
-                print(f"[WARN] VAE Tiling failed: {e}")
-                print("[INFO] Retrying without VAE tiling...")
-                if progress_callback: progress_callback(0) # Reset progress
-                result = run_inference(False)
-            else:
-                raise e
+        if self.stream is not None:
+            self.stream.wait_stream(torch.cuda.current_stream())
+            stream_ctx = torch.cuda.stream(self.stream)
+        else:
+            stream_ctx = contextlib.nullcontext()
+        
+        with stream_ctx:
+            try:
+                # Try with requested tiling setting
+                result = run_inference(use_tiling)
+            except RuntimeError as e:
+                if "cannot reshape tensor" in str(e) and use_tiling:
+                    print(f"[WARN] VAE Tiling failed: {e}")
+                    print("[INFO] Retrying without VAE tiling...")
+                    if progress_callback: progress_callback(0) # Reset progress
+                    result = run_inference(False)
+                else:
+                    raise e
         
         if progress_callback: progress_callback(100)
         return result
     
+    @staticmethod
+    def decode_base64_image(base64_image: str) -> Image.Image:
+        """Base64 image -> RGB PIL Image (transparency flattened onto white)"""
+        with Image.open(io.BytesIO(base64.b64decode(base64_image))) as input_image:
+            if input_image.mode == 'RGBA':
+                rgb_image = Image.new('RGB', input_image.size, (255, 255, 255))
+                rgb_image.paste(input_image, mask=input_image.split()[3])
+                return rgb_image
+            return input_image.convert('RGB')
+    
     def enhance_from_base64(
         self,
         base64_image: str,
@@ -321,8 +354,9 @@ class SDXLEngine:
         seed: Optional[int] = None,
         use_tiling: bool = True,
         progress_callback: Optional[Callable[[int], None]] = None,
-        preview_callback: Optional[Callable[[str, int], None]] = None
-    ) -> str:
+        preview_callback: Optional[Callable[[str, int], None]] = None,
+        return_pil: bool = False
+    ) -> Tuple[Union[str, Image.Image], int, int]:
         """
         Enhance from base64 string, return base64 string
         
@@ -330,22 +364,14 @@ class SDXLEngine:
             base64_image: Base64 encoded image
             modules: Enhancement modules to enable
             preview_callback: Optional callback(base64_image, step) for live preview
+            return_pil: Return the PIL Image instead of base64 PNG, for callers
+                        that hand the result straight to another engine
             Other args: Same as enhance_image()
             
         Returns:
-            Base64 encoded enhanced image
+            (base64_png or PIL Image, width, height) of the enhanced image
         """
-        # Decode base64 to PIL Image
-        image_data = base64.b64decode(base64_image)
-        input_image = Image.open(io.BytesIO(image_data))
-        
-        # Convert RGBA to RGB if needed
-        if input_image.mode == 'RGBA':
-            rgb_image = Image.new('RGB', input_image.size, (255, 255, 255))
-            rgb_image.paste(input_image, mask=input_image.split()[3])
-            input_image = rgb_image
-        elif input_image.mode != 'RGB':
-            input_image = input_image.convert('RGB')
+        input_image = self.decode_base64_image(base64_image)
         
         # Process
         output_image = self.enhance_image(
@@ -361,12 +387,15 @@ class SDXLEngine:
             preview_callback=preview_callback
         )
         
+        if return_pil:
+            return output_image, output_image.width, output_image.height
+        
         buffer = io.BytesIO()
-        output_image.save(buffer, format='PNG')
+        output_image.save(buffer, format='PNG', compress_level=1)
         buffer.seek(0)
         result_base64 = base64.b64encode(buffer.read()).decode('utf-8')
         
-        return result_base64
+        return result_base64, output_image.width, output_image.height
     
     def unload(self):
         """Free GPU memory"""
@@ -9,10 +9,15 @@ import numpy as np
 from pathlib import Path
 from PIL import Image
 import io
-import base64
+try:
+    import pybase64 as base64  # Optional drop-in, SIMD accelerated
+except ImportError:
+    import base64
 from omegaconf import OmegaConf
 from diffusers import AutoencoderKL
 
+from engines.torch_utils import pil_to_device, maybe_compile
+
 # Add repo to sys.path
 REPO_PATH = Path(__file__).parent.parent / "SupResDiffGAN_repo"
 sys.path.insert(0, str(REPO_PATH))
@@ -33,9 +38,10 @@ except ImportError as e:
     from SupResDiffGAN.modules.UNet import UNet as UNet_supresdiffgan
 
 class SupResDiffGANEngine:
-    def __init__(self, model_path: str, device: str = 'cuda'):
+    def __init__(self, model_path: str, device: str = 'cuda', half: bool = False):
         self.device = device
         self.model_path = model_path
+        self.half = half and device == 'cuda'  # FP16 autocast for inference
         
         print(f"Initializing SupResDiffGAN from {model_path} on {device}...")
         
@@ -109,6 +115,9 @@ class SupResDiffGANEngine:
             strict=False # Allow missing discriminator weights
         )
         
+        # In place, after the weights are loaded: the model keeps calling this unet
+        maybe_compile(unet, device.type, "SupResDiffGAN UNet")
+        
         return model
 
     def upscale_from_base64(
@@ -121,7 +130,65 @@ class SupResDiffGANEngine:
         # Decode
         if progress_callback: progress_callback(5)
         image_data = base64.b64decode(base64_image)
-        input_image = Image.open(io.BytesIO(image_data)).convert('RGB')
+        input_image = Image.open(io.BytesIO(image_data))
+        
+        result_base64, _, _ = self.upscale_from_pil(
+            input_image,
+            scale_factor,
+            use_tiling=use_tiling,
+            progress_callback=progress_callback
+        )
+        
+        return result_base64
+    
+    def upscale_from_pil(
+        self,
+        input_image: Image.Image,
+        scale_factor: int = 4,
+        use_tiling: bool = True,
+        progress_callback=None
+    ):
+        """Upscale an already decoded PIL Image, return (base64_png, width, height)"""
+        png_bytes, width, height = self.upscale_to_png_bytes(
+            input_image,
+            scale_factor,
+            use_tiling=use_tiling,
+            progress_callback=progress_callback
+        )
+        return base64.b64encode(png_bytes).decode('utf-8'), width, height
+
+    def upscale_to_png_bytes(
+        self,
+        input_image: Image.Image,
+        scale_factor: int = 4,
+        use_tiling: bool = True,
+        progress_callback=None
+    ):
+        """Upscale a PIL Image, return (png_bytes, width, height) without base64 encoding"""
+        output_image = self.upscale_to_pil(
+            input_image,
+            scale_factor,
+            use_tiling=use_tiling,
+            progress_callback=progress_callback
+        )
+        
+        # Encode
+        buffer = io.BytesIO()
+        output_image.save(buffer, format='PNG', compress_level=1)
+        
+        if progress_callback: progress_callback(100)
+        
+        return buffer.getvalue(), output_image.width, output_image.height
+
+    def upscale_to_pil(
+        self,
+        input_image: Image.Image,
+        scale_factor: int = 4,
+        use_tiling: bool = True,
+        progress_callback=None
+    ) -> Image.Image:
+        """Upscale a PIL Image without encoding the result"""
+        input_image = input_image.convert('RGB')
         
         # Pre-upscale using Bicubic
         target_width = input_image.width * scale_factor
@@ -129,14 +196,14 @@ class SupResDiffGANEngine:
         
         upscaled_input = input_image.resize((target_width, target_height), Image.BICUBIC)
         
-        # Convert to tensor [-1, 1]
-        img_tensor = torch.from_numpy(np.array(upscaled_input)).float() / 127.5 - 1.0
-        img_tensor = img_tensor.permute(2, 0, 1).unsqueeze(0).to(self.device)
+        # Upload uint8 pixels (pinned on CUDA), convert to [-1, 1] on the device
+        img_tensor = pil_to_device(upscaled_input, self.device)
+        img_tensor = img_tensor.permute(2, 0, 1).unsqueeze(0).float().div_(127.5).sub_(1.0)
         
         if progress_callback: progress_callback(20)
         
         # Inference
-        with torch.no_grad():
+        with torch.no_grad(), torch.autocast('cuda', dtype=torch.float16, enabled=self.half):
             if use_tiling:
                 output = self._process_tiled(img_tensor, tile_size=512, overlap=32, progress_callback=progress_callback)
             else:
@@ -144,20 +211,10 @@ class SupResDiffGANEngine:
                 if progress_callback: progress_callback(90)
             
         # Post-process
-        output = (output.clamp(-1, 1) + 1) / 2.0 * 255.0
+        output = (output.float().clamp(-1, 1) + 1) / 2.0 * 255.0
         output = output.cpu().permute(0, 2, 3, 1).numpy().astype(np.uint8)[0]
         
-        output_image = Image.fromarray(output)
-        
-        # Encode
-        buffer = io.BytesIO()
-        output_image.save(buffer, format='PNG')
-        buffer.seek(0)
-        result_base64 = base64.b64encode(buffer.read()).decode('utf-8')
-        
-        if progress_callback: progress_callback(100)
-        
-        return result_base64
+        return Image.fromarray(output)
 
     def _process_tiled(self, img_tensor, tile_size=512, overlap=32, progress_callback=None):
         """Process image in tiles to save memory"""
@@ -10,23 +10,29 @@ import torch
 import numpy as np
 from PIL import Image
 import io
-import base64
+try:
+    import pybase64 as base64  # Optional drop-in, SIMD accelerated
+except ImportError:
+    import base64
 from pathlib import Path
 from typing import Optional, Callable, Tuple
 
+from engines.torch_utils import pil_to_device, maybe_compile
+
 # Add backend/models to path for network_swinir import
 sys.path.insert(0, str(Path(__file__).parent.parent / "models"))
 from network_swinir import SwinIR as net
 
 
 class SwinIREngine:
-    def __init__(self, model_path: str, device: Optional[str] = None):
+    def __init__(self, model_path: str, device: Optional[str] = None, half: bool = False):
         """
         Initialize SwinIR upscaler
         
         Args:
             model_path: Path to .pth model file
             device: 'cuda' or 'cpu', auto-detects if None
+            half: Run inference under FP16 autocast (CUDA only)
         """
         self.model_path = Path(model_path)
         
@@ -44,6 +50,8 @@ class SwinIREngine:
         else:
             self.device = device
         
+        self.half = half and self.device == 'cuda'
+        
         print(f"SwinIR Engine initializing on {self.device.upper()}...")
         
         # Model parameters for Real-World SR Large 4x
@@ -65,7 +73,7 @@ class SwinIREngine:
         self.model = net(**self.model_params)
         
         # Load pretrained weights
-        pretrained_model = torch.load(str(self.model_path), map_location=self.device)
+        pretrained_model = self._load_weights()
         param_key_g = 'params_ema'  # Key for real-world SR models
         
         if param_key_g in pretrained_model:
@@ -83,11 +91,30 @@ class SwinIREngine:
         for param in self.model.parameters():
             param.requires_grad = False
         
+        maybe_compile(self.model, self.device, "SwinIR")
+        
         print(f"[OK] SwinIR-L Engine ready!")
         print(f"[Info] Model: Real-World SR 4x (Large)")
         print(f"[Info] Window size: 8")
         if self.device == 'cuda':
             print(f"[Info] GPU acceleration enabled")
+        if self.half:
+            print(f"[Info] FP16 autocast enabled")
+    
+    def _load_weights(self) -> dict:
+        """
+        Load the checkpoint memory-mapped on CPU: pages are read lazily and stay
+        in the OS page cache, so reloading after an LRU eviction skips the disk.
+        The state dict is copied to the GPU by model.to() afterwards.
+        """
+        if self.model_path.suffix == '.safetensors':
+            from safetensors.torch import load_file
+            return load_file(str(self.model_path), device='cpu')
+        try:
+            return torch.load(str(self.model_path), map_location='cpu', mmap=True, weights_only=True)
+        except RuntimeError:
+            # Legacy (non-zipfile) checkpoints can't be memory-mapped
+            return torch.load(str(self.model_path), map_location='cpu', weights_only=True)
     
     def upscale_image(
         self,
@@ -117,18 +144,15 @@ class SwinIREngine:
         if progress_callback:
             progress_callback(5)
         
-        # Convert PIL to numpy
-        img_np = np.array(input_image).astype(np.float32) / 255.0
-        
-        # Convert to torch tensor [C, H, W]
-        img_tensor = torch.from_numpy(np.transpose(img_np, (2, 0, 1))).float()
-        img_tensor = img_tensor.unsqueeze(0).to(self.device)  # [1, C, H, W]
+        # Upload uint8 pixels (pinned on CUDA), convert to float on the device
+        img_tensor = pil_to_device(input_image, self.device)
+        img_tensor = img_tensor.permute(2, 0, 1).unsqueeze(0).float().div_(255.0)  # [1, C, H, W]
         
         if progress_callback:
             progress_callback(10)
         
         # Inference with tiling for large images
-        with torch.no_grad():
+        with torch.no_grad(), torch.autocast('cuda', dtype=torch.float16, enabled=self.half):
             _, _, h_old, w_old = img_tensor.size()
             
             # Check if tiling is needed
@@ -216,31 +240,86 @@ class SwinIREngine:
         image_data = base64.b64decode(base64_image)
         input_image = Image.open(io.BytesIO(image_data))
         
+        result_base64, _, _ = self.upscale_from_pil(
+            input_image,
+            scale_factor,
+            use_tiling=use_tiling,
+            progress_callback=progress_callback
+        )
+        
+        return result_base64
+    
+    def upscale_from_pil(
+        self,
+        input_image: Image.Image,
+        scale_factor: int = 4,
+        use_tiling: bool = True,
+        progress_callback: Optional[Callable[[int], None]] = None
+    ) -> Tuple[str, int, int]:
+        """
+        Upscale an already decoded PIL Image (skips the base64 decode)
+        
+        Returns:
+            (base64_png, width, height) of the upscaled image
+        """
+        png_bytes, width, height = self.upscale_to_png_bytes(
+            input_image,
+            scale_factor,
+            use_tiling=use_tiling,
+            progress_callback=progress_callback
+        )
+        return base64.b64encode(png_bytes).decode('utf-8'), width, height
+    
+    def upscale_to_pil(
+        self,
+        input_image: Image.Image,
+        scale_factor: int = 4,
+        use_tiling: bool = True,
+        progress_callback: Optional[Callable[[int], None]] = None
+    ) -> Image.Image:
+        """Upscale a PIL Image without encoding the result (same arguments as upscale_to_png_bytes)"""
         # Set tile size based on use_tiling
         # If tiling is disabled, use a very large tile size to force single pass
         tile_size = 512 if use_tiling else 10000
         
-        # Upscale
-        output_image = self.upscale_image(
+        return self.upscale_image(
             input_image,
             scale_factor,
             tile_size=tile_size,
             progress_callback=progress_callback
         )
+    
+    def upscale_to_png_bytes(
+        self,
+        input_image: Image.Image,
+        scale_factor: int = 4,
+        use_tiling: bool = True,
+        progress_callback: Optional[Callable[[int], None]] = None
+    ) -> Tuple[bytes, int, int]:
+        """
+        Upscale a PIL Image and return raw PNG bytes (no base64 encode)
+        
+        Returns:
+            (png_bytes, width, height) of the upscaled image
+        """
+        output_image = self.upscale_to_pil(
+            input_image,
+            scale_factor,
+            use_tiling=use_tiling,
+            progress_callback=progress_callback
+        )
         
         # Encode back to base64
         if progress_callback:
             progress_callback(98)
         
         buffer = io.BytesIO()
-        output_image.save(buffer, format='PNG')
-        buffer.seek(0)
-        result_base64 = base64.b64encode(buffer.read()).decode('utf-8')
+        output_image.save(buffer, format='PNG', compress_level=1)
         
         if progress_callback:
             progress_callback(100)
         
-        return result_base64
+        return buffer.getvalue(), output_image.width, output_image.height
     
     def get_output_dimensions(self, width: int, height: int, scale: int) -> Tuple[int, int]:
         """Calculate output dimensions (always 4x for this model)"""
@@ -0,0 +1,84 @@
+"""
+Shared torch helpers for the engines
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+
+# Inductor caches compiled kernels on disk, so only the first run after an
+# install pays the torch.compile time
+os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', str(Path.home() / '.cache' / 'lumascale' / 'inductor'))
+
+# LUMASCALE_COMPILE=1 compiles the engines' hot modules (mode 'reduce-overhead');
+# any other value is passed through as the torch.compile mode
+COMPILE_MODE = os.getenv('LUMASCALE_COMPILE')
+
+
+class PinnedBufferPool:
+    """
+    Small LRU pool of pinned (page-locked) uint8 host buffers keyed by shape.
+
+    Copies from pinned memory go through DMA and can run asynchronously, while
+    pageable copies are staged and block the calling thread. Pinning is slow
+    (cudaHostAlloc), so buffers are kept and reused for repeated input sizes.
+    """
+
+    def __init__(self, max_entries: int = 4):
+        self.max_entries = max_entries
+        self._buffers = OrderedDict()  # shape -> (pinned tensor, copy-done event)
+        self._lock = threading.Lock()
+
+    def upload(self, array: np.ndarray, device: str = 'cuda') -> torch.Tensor:
+        """Copy a uint8 array to the device through a pinned staging buffer"""
+        if device != 'cuda':
+            return torch.from_numpy(np.array(array, dtype=np.uint8))
+
+        with self._lock:
+            entry = self._buffers.pop(array.shape, None)
+            if entry is None:
+                entry = (torch.empty(array.shape, dtype=torch.uint8).pin_memory(), torch.cuda.Event())
+                if len(self._buffers) >= self.max_entries:
+                    self._buffers.popitem(last=False)
+            self._buffers[array.shape] = entry
+
+            buf, done = entry
+            # The previous non_blocking copy out of this buffer must finish
+            # before it is overwritten
+            done.synchronize()
+            buf.numpy()[...] = array
+            gpu = buf.to(device, non_blocking=True)
+            done.record()
+            return gpu
+
+
+# Shared by all engines (inference runs one job at a time)
+PINNED_POOL = PinnedBufferPool()
+
+
+def pil_to_device(image: Image.Image, device: str = 'cuda') -> torch.Tensor:
+    """RGB PIL Image -> HxWx3 uint8 tensor on device (pinned upload on CUDA)"""
+    return PINNED_POOL.upload(np.asarray(image.convert('RGB')), device)
+
+
+def maybe_compile(module: torch.nn.Module, device: str = 'cuda', name: str = 'model'):
+    """
+    Compile module in place when LUMASCALE_COMPILE is set (CUDA only).
+
+    Module.compile() keeps the original state_dict keys and the module object,
+    so references held elsewhere pick up the compiled forward too. Compilation
+    itself happens on the first call and lasts as long as the engine is loaded.
+    """
+    if not COMPILE_MODE or device != 'cuda':
+        return
+    mode = 'reduce-overhead' if COMPILE_MODE == '1' else COMPILE_MODE
+    try:
+        module.compile(mode=mode, fullgraph=False)
+        print(f"[Info] torch.compile enabled for {name} (mode={mode})")
+    except Exception as e:
+        print(f"[!] torch.compile unavailable for {name}, running eager: {e}")
@@ -0,0 +1,25 @@
+"""
+Gunicorn configuration for the LumaScale backend (Linux/macOS)
+
+Usage (from backend/):
+    gunicorn -c gunicorn_conf.py server:app
+
+Single worker: the GPU engines are in-process singletons, so extra
+workers would each load their own copy of the models. Threads give
+I/O concurrency for /status, /progress and SSE streams. Every open SSE
+stream holds a thread, so raise LUMASCALE_THREADS for many viewers.
+"""
+
+import os
+
+bind = "0.0.0.0:5555"
+workers = 1
+worker_class = "gthread"
+threads = int(os.getenv("LUMASCALE_THREADS", "16"))
+timeout = 600  # SDXL first load + inference can take minutes
+
+
+def post_fork(server, worker):
+    """Run the startup sequence once per worker, after the fork"""
+    from server import startup_sequence
+    startup_sequence()
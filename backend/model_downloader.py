@@ -5,12 +5,19 @@ Auto-downloads required AI models with progress tracking and resume capability
 
 import os
 import json
+import time
+import threading
 import requests
 from pathlib import Path
 from typing import Dict, Callable, Optional
 
 
 class ModelDownloader:
+    # /status and /models/status are polled by the frontend; the answer only
+    # changes when a download finishes, so the models dir is re-scanned at most
+    # this often (downloads through this class invalidate it right away)
+    EXISTS_TTL = 5.0
+    
     def __init__(self, models_dir: str = None):
         # Always use project root models/ directory
         if models_dir is None:
@@ -25,6 +32,10 @@ class ModelDownloader:
         self.models_dir.mkdir(exist_ok=True)
         self.manifest_path = self.models_dir / "model-manifest.json"
         self.manifest = self._load_manifest()
+        
+        self._exists_cache: Optional[Dict[str, bool]] = None
+        self._exists_checked_at = 0.0
+        self._exists_lock = threading.Lock()
     
     def _load_manifest(self) -> Dict:
         """Load model manifest defining what to download"""
@@ -139,7 +150,11 @@ class ModelDownloader:
             return False
 
     def check_model_exists(self, model_key: str) -> bool:
-        """Check if model is already downloaded and valid"""
+        """Check if model is already downloaded and valid (cached, see EXISTS_TTL)"""
+        return self.check_models_exist().get(model_key, False)
+    
+    def _check_model_file(self, model_key: str) -> bool:
+        """Check a single model file on disk, including the GGUF integrity check"""
         if model_key not in self.manifest:
             return False
         
@@ -161,9 +176,7 @@ class ModelDownloader:
         actual_size = model_path.stat().st_size
         expected_size = model_info["size"]
         
-        # Allow 5% variance for size check (HuggingFace sizes can vary slightly)
-        size_diff = abs(actual_size - expected_size) / expected_size
-        if size_diff >= 0.05:
+        if not self._size_matches(actual_size, expected_size):
             return False
             
         # Extra check for GGUF files
@@ -178,13 +191,58 @@ class ModelDownloader:
                 
         return True
     
+    @staticmethod
+    def _size_matches(actual_size: int, expected_size: int) -> bool:
+        # Allow 5% variance for size check (HuggingFace sizes can vary slightly)
+        return abs(actual_size - expected_size) / expected_size < 0.05
+    
+    def check_models_exist(self) -> Dict[str, bool]:
+        """Existence of every manifest model, re-scanned at most every EXISTS_TTL seconds"""
+        with self._exists_lock:
+            now = time.monotonic()
+            if self._exists_cache is None or now - self._exists_checked_at >= self.EXISTS_TTL:
+                self._exists_cache = self._scan_models()
+                self._exists_checked_at = now
+            return dict(self._exists_cache)
+    
+    def invalidate_exists_cache(self):
+        """Force the next check_models_exist() to re-scan the models dir"""
+        with self._exists_lock:
+            self._exists_cache = None
+    
+    def _scan_models(self) -> Dict[str, bool]:
+        """
+        Check every manifest model at once: one directory scan per subdir
+        instead of separate exists()/stat() calls per model.
+        GGUF models still go through _check_model_file() for the integrity check.
+        """
+        listings = {}
+        result = {}
+        for model_key, model_info in self.manifest.items():
+            if model_info.get("type") == "gguf":
+                result[model_key] = self._check_model_file(model_key)
+                continue
+            
+            subdir = model_info.get("subdir", "")
+            if subdir not in listings:
+                target_dir = self.models_dir / subdir if subdir else self.models_dir
+                try:
+                    with os.scandir(target_dir) as it:
+                        listings[subdir] = {entry.name: entry for entry in it}
+                except FileNotFoundError:
+                    listings[subdir] = {}
+            
+            entry = listings[subdir].get(model_info["filename"])
+            result[model_key] = (
+                entry is not None
+                and entry.is_file()
+                and self._size_matches(entry.stat().st_size, model_info["size"])
+            )
+        return result
+    
     def get_missing_models(self) -> list:
         """Returns list of model keys that need to be downloaded"""
-        missing = []
-        for model_key in self.manifest.keys():
-            if not self.check_model_exists(model_key):
-                missing.append(model_key)
-        return missing
+        return [key for key, exists in self.check_models_exist().items() if not exists]
     
     def download_model(
         self, 
@@ -231,8 +289,9 @@ class ModelDownloader:
             resume_byte_pos = temp_path.stat().st_size
             print(f"Resuming download from {resume_byte_pos:,} bytes")
         
-        # Setup headers for resume
-        headers = {}
+        # Setup headers for resume. identity: the CDN behind the HF redirect must
+        # not compress, so Content-Length and Range offsets count file bytes
+        headers = {'Accept-Encoding': 'identity'}
         if resume_byte_pos > 0:
             headers['Range'] = f'bytes={resume_byte_pos}-'
         
@@ -275,6 +334,7 @@ class ModelDownloader:
             
             # Move temp file to final location
             temp_path.rename(model_path)
+            self.invalidate_exists_cache()
             print(f"✓ {model_name} downloaded successfully!")
             return True
             
@@ -3,10 +3,13 @@ LumaScale Model Manager
 Handles lazy loading and unloading of AI models to manage VRAM usage.
 """
 
+import os
 import torch
 import gc
 import sys
-from typing import Dict, Optional, Any
+import threading
+import contextlib
+from typing import Dict, List, Optional, Any
 from pathlib import Path
 
 # Ensure backend is in path
@@ -21,113 +24,211 @@ from engines.qwen_engine import QwenEngine
 from engines.gfpgan_engine import GFPGANEngine
 from engines.inpaint_engine import InpaintEngine
 
+# Rough VRAM needed to load + run each engine (GB), used to decide how many
+# resident models have to be evicted before loading another one
+MODEL_VRAM_ESTIMATE_GB = {
+    "esrgan": 1.0,
+    "swinir": 1.5,
+    "gfpgan": 1.0,
+    "supresdiffgan": 4.0,
+    "qwen": 6.0,
+    "sdxl": 10.0,
+    "inpaint": 10.0,
+}
+
 class ModelManager:
     def __init__(self, downloader: ModelDownloader):
         self.downloader = downloader
         self.loaded_models: Dict[str, Any] = {}
         self.active_model_key: Optional[str] = None
+        # Loaded model keys, least recently used first
+        self.lru_order: List[str] = []
+        # Models a running request chain will come back to (see reserve());
+        # evicted only when nothing else is left to evict
+        self.pinned: set = set()
+        
+        # Serializes loads/unloads so two request threads can't swap the
+        # active CUDA model under each other. Re-entrant: get_model calls unload_all.
+        self.lock = threading.RLock()
         
         # Determine device once
         self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        print(f"ModelManager initialized. Device: {self.device}")
+        # LUMASCALE_FP16=1 runs the FP32-by-default engines (SwinIR, SupResDiffGAN)
+        # under FP16 autocast. ESRGAN and SDXL already load in FP16 on CUDA.
+        self.half = self.device == 'cuda' and os.getenv('LUMASCALE_FP16') == '1'
+        
+        print(f"ModelManager initialized. Device: {self.device}" + (" (FP16)" if self.half else ""))
 
-    def unload_all(self):
-        """Unload all models to free VRAM"""
-        if not self.loaded_models:
-            return
+    def unload_all(self, empty_cache: bool = True):
+        """
+        Unload all models to free VRAM
+        
+        Args:
+            empty_cache: Also return PyTorch's cached blocks to the driver.
+                         Skipped on model switches: the next model reuses the
+                         cached blocks instead of cudaMalloc'ing them again
+                         (the allocator frees its cache by itself before an OOM).
+        """
+        with self.lock:
+            if not self.loaded_models:
+                return
 
-        print("Unloading all models...")
-        keys = list(self.loaded_models.keys())
-        for key in keys:
-            print(f"  - Unloading {key}")
-            # Explicitly delete the object
-            del self.loaded_models[key]
+            print("Unloading all models...")
+            keys = list(self.loaded_models.keys())
+            for key in keys:
+                print(f"  - Unloading {key}")
+                # Explicitly delete the object
+                del self.loaded_models[key]
+        
+            self.loaded_models = {}
+            self.lru_order = []
+            self.active_model_key = None
         
-        self.loaded_models = {}
-        self.active_model_key = None
+            # Force Garbage Collection
+            gc.collect()
         
-        # Force Garbage Collection
+            # Clear CUDA cache
+            if empty_cache and self.device == 'cuda':
+                torch.cuda.empty_cache()
+                torch.cuda.ipc_collect()
+        
+            print("VRAM cleared.")
+
+    def _unload(self, model_key: str):
+        """Unload a single model, leaving the allocator cache for the next load"""
+        print(f"  - Unloading {model_key}")
+        del self.loaded_models[model_key]
+        self.lru_order.remove(model_key)
+        if self.active_model_key == model_key:
+            self.active_model_key = None
         gc.collect()
+
+    def _free_vram_gb(self) -> float:
+        """VRAM available to this process: driver-free plus our own unused cache"""
+        free, _ = torch.cuda.mem_get_info()
+        cached = torch.cuda.memory_reserved() - torch.cuda.memory_allocated()
+        return (free + cached) / 1024**3
+
+    def _make_room(self, model_key: str):
+        """
+        Evict least recently used models until model_key is expected to fit.
+        On CUDA resident models are kept as long as there is room (GPU as a
+        cache); on CPU we keep the "Single Active Model" policy.
+        """
+        if not self.loaded_models:
+            return
         
-        # Clear CUDA cache
-        if self.device == 'cuda':
-            torch.cuda.empty_cache()
-            torch.cuda.ipc_collect()
+        if self.device != 'cuda':
+            print(f"Switching models: {self.active_model_key} -> {model_key}")
+            self.unload_all(empty_cache=False)
+            return
         
-        print("VRAM cleared.")
+        needed = MODEL_VRAM_ESTIMATE_GB.get(model_key, 4.0)
+        while self.lru_order and self._free_vram_gb() < needed:
+            victim = next((k for k in self.lru_order if k not in self.pinned), self.lru_order[0])
+            print(f"Evicting {victim} to make room for {model_key} (~{needed:.0f} GB)")
+            self._unload(victim)
+
+    @contextlib.contextmanager
+    def reserve(self, *model_keys: str):
+        """
+        Keep model_keys resident while the block runs, e.g. SDXL while ESRGAN
+        is loaded for the upscale step of /enhance. Other models are evicted
+        first; a reserved one only goes if the new model can't fit otherwise.
+        """
+        with self.lock:
+            added = [k for k in model_keys if k not in self.pinned]
+            self.pinned.update(added)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.pinned.difference_update(added)
+
+    def preload(self, model_key: str):
+        """Load a model ahead of the request that will need it (errors are only logged)"""
+        try:
+            self.get_model(model_key)
+        except Exception as e:
+            print(f"[!] Preloading {model_key} failed: {e}")
 
     def get_model(self, model_key: str):
         """
         Get a model instance, loading it if necessary.
-        Unloads other models to ensure VRAM availability.
+        Evicts least recently used models when VRAM is needed.
         """
-        # If already loaded, return it
-        if model_key in self.loaded_models:
-            self.active_model_key = model_key
-            return self.loaded_models[model_key]
+        with self.lock:
+            # If already loaded, return it
+            if model_key in self.loaded_models:
+                self.active_model_key = model_key
+                self.lru_order.remove(model_key)
+                self.lru_order.append(model_key)
+                return self.loaded_models[model_key]
             
-        # If another model is loaded, unload it
-        # We implement a "Single Active Model" policy for safety
-        if self.active_model_key is not None and self.active_model_key != model_key:
-            print(f"Switching models: {self.active_model_key} -> {model_key}")
-            self.unload_all()
+            self._make_room(model_key)
             
-        # Load the requested model
-        print(f"Loading model: {model_key}...")
-        engine = None
+            # Load the requested model
+            print(f"Loading model: {model_key}...")
+            engine = None
         
-        try:
-            if model_key == "esrgan":
-                path = self.downloader.get_model_path("upscale_esrgan")
-                if not path: raise FileNotFoundError("ESRGAN model not found")
-                engine = ESRGANEngine(str(path), device=self.device)
+            try:
+                if model_key == "esrgan":
+                    path = self.downloader.get_model_path("upscale_esrgan")
+                    if not path: raise FileNotFoundError("ESRGAN model not found")
+                    engine = ESRGANEngine(str(path), device=self.device)
                 
-            elif model_key == "swinir":
-                path = self.downloader.get_model_path("upscale_swinir")
-                if not path: raise FileNotFoundError("SwinIR model not found")
-                engine = SwinIREngine(str(path), device=self.device)
+                elif model_key == "swinir":
+                    path = self.downloader.get_model_path("upscale_swinir")
+                    if not path: raise FileNotFoundError("SwinIR model not found")
+                    engine = SwinIREngine(str(path), device=self.device, half=self.half)
                 
-            elif model_key == "supresdiffgan":
-                path = self.downloader.get_model_path("supresdiffgan")
-                if not path: raise FileNotFoundError("SupResDiffGAN model not found")
-                engine = SupResDiffGANEngine(str(path), device=self.device)
+                elif model_key == "supresdiffgan":
+                    path = self.downloader.get_model_path("supresdiffgan")
+                    if not path: raise FileNotFoundError("SupResDiffGAN model not found")
+                    engine = SupResDiffGANEngine(str(path), device=self.device, half=self.half)
                 
-            elif model_key == "sdxl":
-                # Use the main SDXL checkpoint (same as Make It Real)
-                path = self.downloader.get_model_path("checkpoint_makeitreal")
-                if not path: raise FileNotFoundError("SDXL model not found. Please ensure checkpoint_makeitreal is downloaded.")
-                engine = SDXLEngine(str(path)) # SDXL engine handles device internally usually, or we should pass it
-                # Checking SDXLEngine source... it usually auto-detects.
+                elif model_key == "sdxl":
+                    # Use the main SDXL checkpoint (same as Make It Real)
+                    path = self.downloader.get_model_path("checkpoint_makeitreal")
+                    if not path: raise FileNotFoundError("SDXL model not found. Please ensure checkpoint_makeitreal is downloaded.")
+                    engine = SDXLEngine(str(path)) # SDXL engine handles device internally usually, or we should pass it
+                    # Checking SDXLEngine source... it usually auto-detects.
             
-            elif model_key == "qwen":
-                path = self.downloader.get_model_path("qwen")
-                if not path: raise FileNotFoundError("Qwen model not found")
-                engine = QwenEngine(str(path), device=self.device)
+                elif model_key == "qwen":
+                    path = self.downloader.get_model_path("qwen")
+                    if not path: raise FileNotFoundError("Qwen model not found")
+                    engine = QwenEngine(str(path), device=self.device)
             
-            elif model_key == "gfpgan":
-                path = self.downloader.get_model_path("gfpgan")
-                if not path: raise FileNotFoundError("GFPGAN model not found")
-                engine = GFPGANEngine(str(path), device=self.device)
+                elif model_key == "gfpgan":
+                    path = self.downloader.get_model_path("gfpgan")
+                    if not path: raise FileNotFoundError("GFPGAN model not found")
+                    engine = GFPGANEngine(str(path), device=self.device)
             
-            elif model_key == "inpaint":
-                # Inpaint uses SDXL model or downloads from HuggingFace
-                path = self.downloader.get_model_path("sdxl")
-                engine = InpaintEngine(str(path) if path else None, device=self.device)
+                elif model_key == "inpaint":
+                    # Inpaint uses SDXL model or downloads from HuggingFace
+                    path = self.downloader.get_model_path("sdxl")
+                    engine = InpaintEngine(str(path) if path else None, device=self.device)
             
-            else:
-                raise ValueError(f"Unknown model key: {model_key}")
+                else:
+                    raise ValueError(f"Unknown model key: {model_key}")
                 
-            if engine:
-                self.loaded_models[model_key] = engine
-                self.active_model_key = model_key
-                print(f"✓ {model_key} loaded successfully")
-                return engine
+                if engine:
+                    self.loaded_models[model_key] = engine
+                    self.lru_order.append(model_key)
+                    self.active_model_key = model_key
+                    print(f"✓ {model_key} loaded successfully")
+                    return engine
                 
-        except Exception as e:
-            print(f"Error loading {model_key}: {e}")
-            # If load failed, ensure we clean up
-            self.unload_all()
-            raise e
+            except Exception as e:
+                print(f"Error loading {model_key}: {e}")
+                # The VRAM estimate was too optimistic: retry once with nothing resident
+                retry = isinstance(e, torch.cuda.OutOfMemoryError) and bool(self.loaded_models)
+                # If load failed, ensure we clean up
+                self.unload_all()
+                if retry:
+                    print(f"Retrying {model_key} with all other models unloaded...")
+                    return self.get_model(model_key)
+                raise e
 
     def get_status(self):
         """Get status of loaded models"""
@@ -142,9 +243,13 @@ class ModelManager:
             try:
                 allocated = torch.cuda.memory_allocated() / 1024**3
                 reserved = torch.cuda.memory_reserved() / 1024**3
+                # Driver view: includes the allocator cache and other processes
+                free, total = torch.cuda.mem_get_info()
                 return {
                     "allocated_gb": round(allocated, 2),
-                    "reserved_gb": round(reserved, 2)
+                    "reserved_gb": round(reserved, 2),
+                    "free_gb": round(free / 1024**3, 2),
+                    "total_gb": round(total / 1024**3, 2)
                 }
             except:
                 return None
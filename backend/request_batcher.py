@@ -0,0 +1,79 @@
+"""
+Request batching for GPU engines
+Collects concurrent requests that share a key (e.g. input size + scale) for a
+few milliseconds and hands them to the engine as one batch.
+"""
+
+import time
+import threading
+import concurrent.futures
+from queue import Queue, Empty
+from typing import Any, Callable, Hashable, List
+
+
+class RequestBatcher:
+    """
+    Groups submitted items by key into batches of up to max_batch.
+
+    A batch is closed max_wait_ms after its first item arrived (or when it is
+    full) and passed to run_batch(key, items), which must return one result
+    per item, in order. Items with a different key wait for the next batch.
+    Batches run one at a time on the batcher's own thread.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[Hashable, List[Any]], List[Any]],
+        max_batch: int = 4,
+        max_wait_ms: float = 25,
+        name: str = 'batcher'
+    ):
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = Queue()
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, key: Hashable, item: Any) -> concurrent.futures.Future:
+        """Queue an item; the returned future resolves to its result"""
+        future = concurrent.futures.Future()
+        self._queue.put((key, item, future))
+        return future
+
+    def _loop(self):
+        held = []  # Items with another key than the open batch, oldest first
+        while True:
+            first = held.pop(0) if held else self._queue.get()
+            key = first[0]
+            batch = [first]
+            rest = []
+            for entry in held:
+                if entry[0] == key and len(batch) < self.max_batch:
+                    batch.append(entry)
+                else:
+                    rest.append(entry)
+            held = rest
+
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=timeout)
+                except Empty:
+                    break
+                (batch if entry[0] == key else held).append(entry)
+
+            self._run(key, batch)
+
+    def _run(self, key: Hashable, batch: list):
+        try:
+            results = self.run_batch(key, [item for _, item, _ in batch])
+        except BaseException as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
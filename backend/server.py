@@ -8,100 +8,448 @@ import os
 import sys
 import json
 import time
-import uuid
-import traceback
-import base64
+import secrets
+import shutil
+import hashlib
+import itertools
+import atexit
+import logging
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 import io
 import threading
-from queue import Queue, Empty
+import concurrent.futures
+import importlib.util
+from dataclasses import dataclass, asdict
+from queue import Queue, Empty, Full
 from PIL import Image
 from pathlib import Path
-from flask import Flask, request, jsonify, Response
+from typing import Optional
+from flask import Flask, request, jsonify, Response, has_request_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+import msgspec
+from cachetools import TTLCache, LRUCache
 import torch
 
+try:
+    import pybase64 as base64  # Optional: SIMD base64 for multi-MB image payloads
+except ImportError:
+    import base64
+try:
+    from flask_compress import Compress  # Optional: gzip/zstd for large JSON bodies
+except ImportError:
+    Compress = None
+try:
+    import orjson  # Optional: much faster JSON for multi-MB base64 responses
+except ImportError:
+    orjson = None
+
 # Add backend to path for imports
 sys.path.insert(0, str(Path(__file__).parent))
 
 from model_downloader import ModelDownloader
 from model_manager import ModelManager
+from engines.sdxl_engine import SDXLEngine
+from engines.esrgan_engine import ESRGANEngine
+from request_batcher import RequestBatcher
 from comfyui_executor import make_it_real as comfyui_make_it_real, get_executor, sdxl_tiled_upscale as comfyui_sdxl_upscale
 from video_service import is_video_file, get_video_info, extract_frames_to_base64
 
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (jsonify, request.get_json, error bodies)"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
-CORS(app)  # Enable CORS for frontend communication
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+# Enable CORS for frontend communication: the Vite dev server (localhost:*)
+# and the packaged Electron app (file:// pages send Origin "null").
+# Extra origins can be added with LUMASCALE_CORS_ORIGINS (comma separated).
+# Preflights are cached by the browser for a day.
+CORS_ORIGINS = [
+    r"^https?://(localhost|127\.0\.0\.1)(:\d+)?$",
+    "null",
+    r"^app://.*$",
+] + [o.strip() for o in os.getenv('LUMASCALE_CORS_ORIGINS', '').split(',') if o.strip()]
+CORS(
+    app,
+    resources={r"/*": {"origins": CORS_ORIGINS}},
+    max_age=86400,
+    supports_credentials=False,
+    # Expose the metadata headers of /upscale/binary to browser clients
+    expose_headers=['X-Request-Id', 'X-Width', 'X-Height', 'X-Processing-Time']
+)
+
+# Cap request bodies so an oversized base64 payload is rejected with a 413
+# before it is buffered. Video uploads raise the limit per request.
+app.config['MAX_CONTENT_LENGTH'] = 64 * 1024 * 1024
+VIDEO_MAX_CONTENT_LENGTH = 2 * 1024 * 1024 * 1024
+
+# Compress JSON responses (base64 image bodies shrink ~3x). Level 3 keeps the
+# CPU cost low; SSE streams are left alone so events aren't buffered.
+if Compress is not None:
+    app.config['COMPRESS_ALGORITHM'] = ['zstd', 'br', 'gzip']
+    app.config['COMPRESS_MIN_SIZE'] = 4096
+    app.config['COMPRESS_LEVEL'] = 3
+    app.config['COMPRESS_ZSTD_LEVEL'] = 3
+    app.config['COMPRESS_BR_LEVEL'] = 3
+    app.config['COMPRESS_STREAMS'] = False
+    Compress(app)
+
+def ojsonify(obj, status: int = 200):
+    """jsonify() replacement that serializes with orjson when it is installed"""
+    if orjson is None:
+        response = jsonify(obj)
+        response.status_code = status
+        return response
+    return app.response_class(orjson.dumps(obj), status=status, mimetype='application/json')
+
+def json_dumps(obj) -> str:
+    """JSON text for SSE events (orjson when installed)"""
+    return orjson.dumps(obj).decode() if orjson is not None else json.dumps(obj)
+
+def ojsonify_conditional(obj):
+    """
+    ojsonify() with an ETag over the body, for polled status routes: a client
+    sending a matching If-None-Match gets a bodyless 304 Not Modified
+    """
+    response = ojsonify(obj)
+    response.set_etag(hashlib.blake2b(response.get_data(), digest_size=8).hexdigest())
+    response.headers['Cache-Control'] = 'no-cache'  # cache, but always revalidate
+    return response.make_conditional(request)
+
+@app.errorhandler(413)
+def handle_payload_too_large(e):
+    """Request body exceeded MAX_CONTENT_LENGTH"""
+    limit_mb = (request.max_content_length or 0) // (1024 * 1024)
+    return ojsonify({
+        "error": f"Request body too large (limit {limit_mb} MB). Downscale the image first.",
+        "type": "PayloadTooLarge"
+    }, 413)
 
 # Global state
 downloader = ModelDownloader()
 manager = ModelManager(downloader)
 
-# Progress tracking (per request)
-progress_store = {}
+# Inference runs on a dedicated worker so request threads stay free for
+# /status and /progress. Single worker: all engines share one CUDA context,
+# and jobs (model load + forward) run FIFO so concurrent requests can't
+# thrash the active model (load SDXL, evict, reload, ...).
+# Grad mode is thread-local: turn autograd off for good on the worker thread
+# (engine calls are additionally wrapped in torch.inference_mode()).
+INFER_POOL = concurrent.futures.ThreadPoolExecutor(
+    max_workers=1,
+    thread_name_prefix='infer',
+    initializer=torch.set_grad_enabled,
+    initargs=(False,)
+)
+INFER_TIMEOUT = 600  # seconds a request waits for its job before a 504
+
+# CPU image codecs (base64 + PNG/JPEG decode/encode) run here instead of on
+# the INFER_POOL worker, so they overlap other requests' GPU work, and at most
+# one per core however many request threads are waiting. PIL releases the GIL
+# inside libpng/libjpeg/zlib.
+DECODE_POOL = concurrent.futures.ThreadPoolExecutor(
+    max_workers=os.cpu_count() or 4,
+    thread_name_prefix='imgdec'
+)
+
+def run_codec_job(fn, *args):
+    """Run an image decode/encode helper on DECODE_POOL and wait for it"""
+    return DECODE_POOL.submit(fn, *args).result()
+
+class ModelLoadError(RuntimeError):
+    """A model could not be loaded (missing weights, bad install, OOM on load)"""
 
-# Live preview store (per request) - holds base64 preview images
-preview_store = {}  # {request_id: Queue()}
+class BadRequestBody(ValueError):
+    """Malformed request body or parameter; routes answer it with a 400"""
+
+def run_inference_job(fn, *args, **kwargs):
+    """
+    Run fn on INFER_POOL and wait for its result
+    
+    fn should do the model lookup (manager.get_model) itself so the swap is
+    serialized with the inference. Raises concurrent.futures.TimeoutError
+    after INFER_TIMEOUT; the job itself keeps running.
+    """
+    return INFER_POOL.submit(fn, *args, **kwargs).result(timeout=INFER_TIMEOUT)
+
+def infer_timeout_response(request_id: str):
+    update_progress(request_id, "⏱ Timed out waiting for the GPU", 0, "error")
+    return ojsonify({
+        "error": f"Inference did not finish within {INFER_TIMEOUT}s",
+        "type": "TimeoutError"
+    }, 504)
+
+# Progress tracking (per request) - bounded LRU with a TTL so entries of
+# requests nobody polls again don't accumulate forever. TTLCache is not
+# thread-safe (even reads reorder it), so all access goes through progress_lock.
+PROGRESS_STORE_MAX = 1024
+PROGRESS_TTL = 600        # seconds an entry lives after its last update
+PROGRESS_DONE_GRACE = 30  # seconds a finished entry stays for late pollers
+progress_store = TTLCache(maxsize=PROGRESS_STORE_MAX, ttl=PROGRESS_TTL)  # {request_id: ProgressRecord}
+progress_lock = threading.Lock()
+# Notified on every progress write so SSE streams wake up instead of polling
+progress_cond = threading.Condition(progress_lock)
+
+# Live preview store (per request) - holds base64 preview images. Streams
+# remove their own queue; the TTL and the reaper catch the ones nobody streams.
+PREVIEW_TTL = 900  # seconds a queue lives after the last preview
+preview_store = TTLCache(maxsize=PROGRESS_STORE_MAX, ttl=PREVIEW_TTL)  # {request_id: Queue()}
+preview_lock = threading.Lock()
+REAPER_INTERVAL = 60  # seconds between _reap_stores sweeps
+# Previews are disposable (only the latest matters): a slow client keeps at
+# most this many frames buffered, older ones are dropped
+PREVIEW_QUEUE_SIZE = 8
+# SSE streams block until there is something to send; this only paces the
+# keepalive comments that stop proxies from closing an idle stream
+SSE_KEEPALIVE = 15  # seconds
+# Pushed into a preview queue when its request finishes, to wake the stream
+PREVIEW_DONE = None
+
+# Per-step progress/preview logging fires dozens of times per request, so it
+# goes through a DEBUG logger that is a no-op unless LUMASCALE_DEV is set
+progress_logger = logging.getLogger('lumascale.progress')
+progress_logger.setLevel(logging.DEBUG if os.getenv('LUMASCALE_DEV') else logging.INFO)
+progress_logger.propagate = False  # not into server.log
+if not progress_logger.handlers:
+    progress_logger.addHandler(logging.StreamHandler(sys.stdout))
+
+class _DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves all formatting, tracebacks included, to the listener"""
+    def prepare(self, record):
+        return record
+
+# Route errors: tracebacks go to a rotating backend/server.log and stderr.
+# Request threads only enqueue the record; a QueueListener thread formats and
+# writes it, so an error burst doesn't serialize the threads on file/stderr I/O.
+logger = logging.getLogger('lumascale')
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    _log_file = RotatingFileHandler(
+        Path(__file__).parent / "server.log", maxBytes=10 << 20, backupCount=3, encoding='utf-8'
+    )
+    _log_file.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    _log_queue = Queue()
+    logger.addHandler(_DeferredQueueHandler(_log_queue))
+    _log_listener = QueueListener(_log_queue, _log_file, logging.StreamHandler(sys.stderr))
+    _log_listener.start()
+    atexit.register(_log_listener.stop)  # flushes what is still queued
+
+# The same (route, exception type) within this window is counted, not logged:
+# during an OOM storm formatting identical tracebacks would dominate the response
+LOG_REPEAT_WINDOW = 1.0
+_log_last_seen = {}  # {(route, exc type name): [monotonic time logged, repeats since]}
+_log_dedup_lock = threading.Lock()
+
+def _log_exception(route: Optional[str] = None):
+    """logger.exception() for the exception being handled, rate limited per route and type"""
+    if route is None:
+        route = request.path if has_request_context() else "worker"
+    exc_type = sys.exc_info()[0]
+    key = (route, exc_type.__name__ if exc_type else "None")
+    now = time.monotonic()
+    
+    with _log_dedup_lock:
+        seen = _log_last_seen.get(key)
+        if seen is not None and now - seen[0] < LOG_REPEAT_WINDOW:
+            seen[1] += 1
+            return
+        repeats = seen[1] if seen is not None else 0
+        _log_last_seen[key] = [now, 0]
+    
+    if repeats:
+        logger.warning("route=%s %s repeat x%d", route, key[1], repeats)
+    logger.exception("route=%s", route)
+
+# Source of ProgressRecord.version: unique across records, so a stream can't
+# mistake a recreated entry for the one it already sent
+_progress_versions = itertools.count(1)
+
+class ProgressRecord:
+    """
+    Progress of one request, updated in place by update_progress - per-step
+    callbacks don't allocate a new dict on every tick. version changes on
+    every write so SSE streams and the done-timer can tell writes apart.
+    """
+    __slots__ = ('status', 'step', 'progress', 'timestamp', 'version')
+    
+    def __init__(self):
+        self.status = "processing"
+        self.step = ""
+        self.progress = 0
+        self.timestamp = 0.0
+        self.version = 0
+    
+    def to_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "step": self.step,
+            "progress": self.progress,
+            "timestamp": self.timestamp
+        }
+
+def _new_request_id() -> str:
+    """Server-generated request id: 16 hex chars, so the [:8] log prefix is half of it"""
+    return secrets.token_hex(8)
 
 def update_progress(request_id: str, step: str, progress: int, status: str = "processing"):
     """Update progress for a specific request"""
-    progress_store[request_id] = {
-        "status": status,
-        "step": step,
-        "progress": progress,
-        "timestamp": time.time()
-    }
-    print(f"[Progress {request_id[:8]}] {step} - {progress}%")
+    with progress_cond:
+        record = progress_store.get(request_id)
+        if record is None:
+            record = ProgressRecord()
+        record.status = status
+        record.step = step
+        record.progress = progress
+        record.timestamp = time.time()
+        record.version = version = next(_progress_versions)
+        progress_store[request_id] = record  # re-set: restarts the TTL
+        progress_cond.notify_all()
+    if status != "processing" or progress % 10 == 0:
+        progress_logger.debug("[Progress %s] %s - %d%%", request_id[:8], step, progress)
+    
+    if status in ("complete", "done", "error"):
+        timer = threading.Timer(PROGRESS_DONE_GRACE, drop_progress, args=(request_id, version))
+        timer.daemon = True
+        timer.start()
+        queue = get_preview_queue(request_id, create=False)
+        if queue is not None:
+            _put_latest(queue, PREVIEW_DONE)
+
+def get_progress_entry(request_id: str) -> Optional[dict]:
+    """Snapshot of a request's progress as a dict, or None"""
+    with progress_lock:
+        record = progress_store.get(request_id)
+        return record.to_dict() if record is not None else None
+
+def _progress_version(request_id: str) -> Optional[int]:
+    """Version of a request's progress record (call with progress_lock held)"""
+    record = progress_store.get(request_id)
+    return record.version if record is not None else None
+
+def drop_progress(request_id: str, expected_version: Optional[int] = None):
+    """
+    Remove a request's progress entry (wakes its SSE stream so it can end)
+    If expected_version is given, only remove it if nothing was written since.
+    """
+    with progress_cond:
+        if expected_version is None or _progress_version(request_id) == expected_version:
+            progress_store.pop(request_id, None)
+            progress_cond.notify_all()
+
+def fail_progress(request_id: Optional[str], error: Exception):
+    """Mark a request as failed: closes its streams and lets its entries be reaped"""
+    if request_id:
+        update_progress(request_id, f"❌ {type(error).__name__}: {error}", 0, "error")
+
+def get_preview_queue(request_id: str, create: bool = True) -> Optional[Queue]:
+    """Preview queue of a request; creating it (or refreshing its TTL) unless create=False"""
+    with preview_lock:
+        queue = preview_store.get(request_id)
+        if create:
+            if queue is None:
+                queue = Queue(maxsize=PREVIEW_QUEUE_SIZE)
+            preview_store[request_id] = queue
+        return queue
+
+def drop_preview_queue(request_id: str):
+    with preview_lock:
+        preview_store.pop(request_id, None)
+
+def _reap_stores():
+    """
+    Background sweep: expire stale progress/preview entries (TTLCache only
+    expires on access) and drop preview queues whose request is gone. A queue
+    must be orphaned on two sweeps in a row, since a preview stream may
+    subscribe shortly before its request reports progress.
+    """
+    orphans = set()
+    while True:
+        time.sleep(REAPER_INTERVAL)
+        with progress_lock:
+            progress_store.expire()
+            live = set(progress_store)
+        with preview_lock:
+            preview_store.expire()
+            current = {rid for rid in preview_store if rid not in live}
+            stale = current & orphans
+            for rid in stale:
+                preview_store.pop(rid, None)
+            orphans = current - stale
+
+def _put_latest(queue: Queue, item):
+    """put_nowait(), dropping the oldest entry while the queue is full"""
+    while True:
+        try:
+            queue.put_nowait(item)
+            return
+        except Full:
+            try:
+                queue.get_nowait()
+            except Empty:
+                pass
 
 def send_preview(request_id: str, image_base64: str, step: int = 0):
     """Send preview image to SSE stream"""
-    if request_id not in preview_store:
-        preview_store[request_id] = Queue()
-    preview_store[request_id].put({
+    _put_latest(get_preview_queue(request_id), {
         "image": image_base64,
         "step": step,
         "timestamp": time.time()
     })
-    print(f"[Preview {request_id[:8]}] Step {step} - sent preview")
+    progress_logger.debug("[Preview %s] Step %d - sent preview", request_id[:8], step)
 
 @app.route('/status', methods=['GET'])
 def get_status():
     """Health check and model availability status"""
-    missing_models = downloader.get_missing_models()
+    exists = downloader.check_models_exist()
+    missing_models = [key for key, ok in exists.items() if not ok]
     manager_status = manager.get_status()
     
     # Determine which models are "ready" (downloaded)
     models_status = {
-        "esrgan": downloader.check_model_exists("upscale_esrgan"),
-        "swinir": downloader.check_model_exists("upscale_swinir"),
-        "supresdiffgan": downloader.check_model_exists("supresdiffgan"),
-        "sdxl": downloader.check_model_exists("sdxl"),
-        "qwen": downloader.check_model_exists("qwen"),
-        "gfpgan": downloader.check_model_exists("gfpgan")
+        "esrgan": exists.get("upscale_esrgan", False),
+        "swinir": exists.get("upscale_swinir", False),
+        "supresdiffgan": exists.get("supresdiffgan", False),
+        "sdxl": exists.get("sdxl", False),
+        "qwen": exists.get("qwen", False),
+        "gfpgan": exists.get("gfpgan", False)
     }
     
-    return jsonify({
+    # Bucket VRAM figures to 0.1 GB so allocator noise doesn't change the ETag
+    vram_usage = manager_status["vram_usage"]
+    if vram_usage:
+        vram_usage = {key: round(value, 1) for key, value in vram_usage.items()}
+    
+    return ojsonify_conditional({
         "status": "online",
         "models": models_status,
         "missing_models": missing_models,
         "models_ready": len(missing_models) == 0,
         "active_model": manager_status["active_model"],
-        "vram_usage": manager_status["vram_usage"]
+        "vram_usage": vram_usage
     })
 
 @app.route('/models/status', methods=['GET'])
 def get_models_status():
     """Detailed model download status"""
+    exists = downloader.check_models_exist()
     status = {}
     for model_key, model_info in downloader.manifest.items():
-        exists = downloader.check_model_exists(model_key)
         status[model_key] = {
             "name": model_info["name"],
             "filename": model_info["filename"],
             "size": model_info["size"],
-            "downloaded": exists
+            "downloaded": exists[model_key]
         }
     
-    missing = downloader.get_missing_models()
-    return jsonify({
+    missing = [key for key, ok in exists.items() if not ok]
+    return ojsonify_conditional({
         "models": status,
         "all_ready": len(missing) == 0,
         "missing": missing
@@ -117,34 +465,42 @@ def cancel_processing():
         
         if response.status_code == 200:
             print("[Cancel] ComfyUI interrupt signal sent successfully")
-            return jsonify({"status": "cancelled", "message": "Processing cancelled"})
+            return ojsonify({"status": "cancelled", "message": "Processing cancelled"})
         else:
             print(f"[Cancel] ComfyUI returned status {response.status_code}")
-            return jsonify({"status": "error", "message": f"ComfyUI error: {response.status_code}"}), 500
+            return ojsonify({"status": "error", "message": f"ComfyUI error: {response.status_code}"}), 500
             
     except requests.exceptions.ConnectionError:
         # ComfyUI not running - nothing to cancel
         print("[Cancel] ComfyUI not running, nothing to cancel")
-        return jsonify({"status": "ok", "message": "No active processing"})
+        return ojsonify({"status": "ok", "message": "No active processing"})
     except Exception as e:
         print(f"[Cancel] Error: {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return ojsonify({"status": "error", "message": str(e)}), 500
 
 # Download progress state
-download_progress = {
-    "active": False,
-    "model": "",
-    "downloaded": 0,
-    "total": 0,
-    "percent": 0,
-    "speed_mbps": 0,
-    "error": None
-}
+@dataclass
+class DownloadProgress:
+    """Mutable download state, updated in place by the downloader callback"""
+    active: bool = False
+    model: str = ""
+    downloaded: int = 0
+    total: int = 0
+    percent: float = 0.0
+    speed_mbps: float = 0.0
+    error: Optional[str] = None
+
+download_progress = DownloadProgress()
+DOWNLOAD_PROGRESS_INTERVAL_NS = 500_000_000
 
 @app.route('/models/download/progress', methods=['GET'])
 def get_download_progress():
     """Get current download progress"""
-    return jsonify(download_progress)
+    state = asdict(download_progress)
+    # Round at poll time rather than on every chunk callback
+    state["percent"] = round(state["percent"], 1)
+    state["speed_mbps"] = round(state["speed_mbps"], 1)
+    return ojsonify(state)
 
 @app.route('/models/download', methods=['POST'])
 def trigger_download():
@@ -153,73 +509,113 @@ def trigger_download():
     
     missing = downloader.get_missing_models()
     if not missing:
-        return jsonify({"status": "complete", "message": "All models already downloaded"})
-    
-    download_progress = {
-        "active": True,
-        "model": "",
-        "downloaded": 0,
-        "total": 0,
-        "percent": 0,
-        "speed_mbps": 0,
-        "error": None
-    }
+        return ojsonify({"status": "complete", "message": "All models already downloaded"})
     
-    import time
-    last_time = [time.time()]
+    download_progress = DownloadProgress(active=True)
+    progress = download_progress
+    
+    last_ns = [time.monotonic_ns()]
     last_bytes = [0]
     
     def progress_callback(model_key, downloaded, total, model_name):
-        global download_progress
-        now = time.time()
-        elapsed = now - last_time[0]
-        
-        # Calculate speed every 0.5 seconds
-        speed = 0
-        if elapsed > 0.5:
-            bytes_diff = downloaded - last_bytes[0]
-            speed = (bytes_diff / elapsed) / (1024 * 1024)  # MB/s
-            last_time[0] = now
-            last_bytes[0] = downloaded
-        else:
-            speed = download_progress.get("speed_mbps", 0)
-        
-        percent = (downloaded / total * 100) if total > 0 else 0
-        download_progress = {
-            "active": True,
-            "model": model_name,
-            "downloaded": downloaded,
-            "total": total,
-            "percent": round(percent, 1),
-            "speed_mbps": round(speed, 1),
-            "error": None
-        }
+        # Called for every downloaded chunk; the UI polls about once a second,
+        # so only publish every DOWNLOAD_PROGRESS_INTERVAL_NS (plus model
+        # switches and the final chunk)
+        now = time.monotonic_ns()
+        elapsed = now - last_ns[0]
+        if (elapsed < DOWNLOAD_PROGRESS_INTERVAL_NS and model_name == progress.model
+                and downloaded < total):
+            return
+        
+        # Exponential moving average of the speed over each interval (MB/s); the
+        # byte counter restarts for each model, so a negative delta counts from zero
+        delta = downloaded - last_bytes[0]
+        inst = (delta if delta >= 0 else downloaded) * 1e9 / max(elapsed, 1_000_000) / (1 << 20)
+        last_ns[0] = now
+        last_bytes[0] = downloaded
+        
+        progress.model = model_name
+        progress.downloaded = downloaded
+        progress.total = total
+        progress.percent = downloaded * 100 / total if total > 0 else 0.0
+        progress.speed_mbps = 0.7 * progress.speed_mbps + 0.3 * inst
     
     try:
         success = downloader.download_all_missing(progress_callback)
-        download_progress["active"] = False
+        download_progress.active = False
         
         if success:
-            return jsonify({
+            return ojsonify({
                 "status": "complete",
                 "message": "All models downloaded successfully",
                 "downloaded": missing
             })
         else:
-            download_progress["error"] = "Some models failed to download"
-            return jsonify({"status": "error", "message": "Some models failed to download"}), 500
+            download_progress.error = "Some models failed to download"
+            return ojsonify({"status": "error", "message": "Some models failed to download"}), 500
     except Exception as e:
-        download_progress["active"] = False
-        download_progress["error"] = str(e)
-        return jsonify({"status": "error", "message": str(e)}), 500
+        download_progress.active = False
+        download_progress.error = str(e)
+        return ojsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/progress/<request_id>', methods=['GET'])
 def get_progress(request_id):
     """Get current progress for a request"""
-    if request_id in progress_store:
-        return jsonify(progress_store[request_id])
+    entry = get_progress_entry(request_id)
+    if entry is not None:
+        return ojsonify(entry)
     else:
-        return jsonify({"status": "unknown", "step": "Not found", "progress": 0}), 404
+        return ojsonify({"status": "unknown", "step": "Not found", "progress": 0}), 404
+
+@app.route('/progress/<request_id>/stream', methods=['GET'])
+@app.route('/progress/stream/<request_id>', methods=['GET'])
+def stream_progress(request_id):
+    """
+    SSE endpoint pushing progress updates for a request.
+    Holds one connection and only sends when update_progress writes a new value,
+    replacing client-side polling of /progress/<request_id>.
+    """
+    def generate():
+        last_version = None
+        idle_count = 0
+        max_idle = 300 // SSE_KEEPALIVE  # 5 minutes without updates
+        
+        while idle_count < max_idle:
+            # Sleep until update_progress writes a new value for this request.
+            # Checked under the lock, so an update can't slip in unnoticed.
+            with progress_cond:
+                changed = progress_cond.wait_for(
+                    lambda: _progress_version(request_id) != last_version,
+                    timeout=SSE_KEEPALIVE
+                )
+                record = progress_store.get(request_id)
+                current = record.to_dict() if record is not None else None
+                last_version = record.version if record is not None else None
+            
+            if not changed:
+                idle_count += 1
+                yield ": keepalive\n\n"
+                continue
+            
+            if current is None:
+                # Entry was cleaned up (by /preview or LRU eviction) - processing is over
+                break
+            
+            yield f"data: {json_dumps(current)}\n\n"
+            idle_count = 0
+            
+            if current.get("status") in ("complete", "done", "error"):
+                break
+    
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'Connection': 'keep-alive',
+            'X-Accel-Buffering': 'no'
+        }
+    )
 
 @app.route('/preview/<request_id>', methods=['GET'])
 def stream_preview(request_id):
@@ -227,45 +623,44 @@ def stream_preview(request_id):
     SSE endpoint for streaming live preview images during processing.
     Sends base64 images as they become available.
     """
+    def finished():
+        with progress_lock:
+            record = progress_store.get(request_id)
+            return record is not None and record.status in ("complete", "done", "error")
+    
     def generate():
         # Initialize queue for this request if not exists
-        if request_id not in preview_store:
-            preview_store[request_id] = Queue()
-        
-        queue = preview_store[request_id]
-        timeout_count = 0
-        max_timeouts = 600  # 5 minutes max (600 * 0.5s)
-        
-        while timeout_count < max_timeouts:
+        queue = get_preview_queue(request_id)
+        idle_count = 0
+        max_idle = 300 // SSE_KEEPALIVE  # 5 minutes max without a preview
+        
+        # Blocks until a preview or the PREVIEW_DONE wake-up arrives. The done
+        # check only runs at subscribe time and on keepalive timeouts, which
+        # catches a request that finished before this stream subscribed.
+        done = finished()
+        while not done and idle_count < max_idle:
             try:
-                # Wait for preview with 0.5s timeout
-                preview_data = queue.get(timeout=0.5)
-                
-                # Send SSE event
-                event_data = json.dumps(preview_data)
-                yield f"data: {event_data}\n\n"
-                
-                timeout_count = 0  # Reset on successful data
-                
+                preview_data = queue.get(timeout=SSE_KEEPALIVE)
             except Empty:
-                timeout_count += 1
-                # Send keepalive every 10 seconds
-                if timeout_count % 20 == 0:
-                    yield f": keepalive\n\n"
-                    
-                # Check if processing is done
-                if request_id in progress_store:
-                    status = progress_store[request_id].get("status", "")
-                    if status in ["done", "error"]:
-                        # Send final event
-                        yield f"data: {json.dumps({'done': True})}\n\n"
-                        break
+                idle_count += 1
+                done = finished()
+                yield f": keepalive\n\n"
+                continue
+            
+            if preview_data is PREVIEW_DONE:
+                break
+            
+            # Send SSE event
+            event_data = json_dumps(preview_data)
+            yield f"data: {event_data}\n\n"
+            idle_count = 0  # Reset on successful data
+        
+        # Send final event
+        yield f"data: {json_dumps({'done': True})}\n\n"
         
         # Cleanup - prevent memory leaks
-        if request_id in preview_store:
-            del preview_store[request_id]
-        if request_id in progress_store:
-            del progress_store[request_id]
+        drop_preview_queue(request_id)
+        drop_progress(request_id)
     
     return Response(
         generate(),
@@ -277,106 +672,399 @@ def stream_preview(request_id):
         }
     )
 
-@app.route('/upscale', methods=['POST'])
-def upscale_image():
+def encode_png(image: Image.Image) -> bytes:
     """
-    Upscaling endpoint with progress tracking
-    Supports: ESRGAN, SwinIR, SupResDiffGAN
+    PNG encode for API responses
+    zlib level 1 encodes several times faster than PIL's default (6) on large
+    images, at the cost of a somewhat larger file.
     """
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+def encode_png_base64(image: Image.Image) -> str:
+    """PNG encode + base64 for API responses"""
+    return base64.b64encode(encode_png(image)).decode('ascii')
+
+# Finished PNGs of clients that sent "result_url": true - the JSON response
+# carries {"url": "/result/<id>"} and the PNG is fetched as binary, instead of
+# inlining it as base64 (+33% size, plus a multi-MB string encode and copy).
+# Bounded by total bytes; the oldest results are evicted first.
+RESULT_STORE_BYTES = 512 * 1024 * 1024
+result_store = LRUCache(maxsize=RESULT_STORE_BYTES, getsizeof=len)  # {request_id: png bytes}
+result_lock = threading.Lock()
+
+def store_result(request_id: str, png_bytes: bytes) -> bool:
+    """Keep a result PNG for /result/<request_id>; False if it is too big to store"""
     try:
-        data = request.get_json()
-        base64_image = data.get('image')
-        scale_factor = data.get('scale_factor', 4)
-        upscaler_name = data.get('upscaler', 'RealESRGAN x4plus')
-        
-        # Use client-provided ID or generate new one
-        request_id = data.get('request_id', str(uuid.uuid4()))
-        
-        if not base64_image:
-            return jsonify({"error": "No image data"}), 400
+        with result_lock:
+            result_store[request_id] = png_bytes
+        return True
+    except ValueError:  # larger than the whole store
+        return False
+
+def result_image_fields(request_id: str, result, want_url: bool) -> dict:
+    """
+    Image part of a JSON response: {"url": ...} when the client asked for a
+    result URL, else {"image": base64 PNG}
+    
+    Args:
+        result: base64 PNG str, PNG bytes or PIL Image (encoded on DECODE_POOL)
+    """
+    if isinstance(result, Image.Image):
+        result = run_codec_job(encode_png, result)
+    if isinstance(result, bytes):
+        if want_url and store_result(request_id, result):
+            return {"url": f"/result/{request_id}"}
+        result = base64.b64encode(result).decode('ascii')
+    return {"image": result}
+
+@app.route('/result/<request_id>', methods=['GET'])
+def get_result(request_id):
+    """Result PNG of a request made with "result_url": true"""
+    with result_lock:
+        png_bytes = result_store.get(request_id)
+    if png_bytes is None:
+        return ojsonify({"error": "Result not found or expired"}), 404
+    return Response(png_bytes, mimetype='image/png')
+
+def _decode_image(image_bytes: bytes) -> Image.Image:
+    """Fully decode an encoded image (Image.open alone only reads the header)"""
+    image = Image.open(io.BytesIO(image_bytes))
+    image.load()
+    return image
+
+def _decode_rgb(image) -> Image.Image:
+    """base64 str or encoded image bytes -> decoded RGB PIL Image"""
+    if isinstance(image, str):
+        image = base64.b64decode(image)
+    with Image.open(io.BytesIO(image)) as im:
+        return im.convert('RGB')
+
+def _get_json_body():
+    """
+    Parse the JSON request body (None if empty)
+    
+    get_data(cache=False) keeps Flask from holding a second copy of the
+    multi-MB base64 body on the request until the response is sent, and
+    orjson parses straight from bytes without building a str first.
+    
+    Raises:
+        BadRequestBody if the body is not a JSON object
+    """
+    raw = request.get_data(cache=False)
+    if not raw:
+        return None
+    try:
+        data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    except ValueError as e:  # orjson/json JSONDecodeError
+        raise BadRequestBody(f"Invalid JSON body: {e}") from None
+    if not isinstance(data, dict):
+        raise BadRequestBody("Request body must be a JSON object")
+    return data
+
+# Typed multipart fields of the single-image routes; everything else
+# (request_id, prompt, ...) stays a string
+_FORM_INT_FIELDS = ('upscale', 'scale_factor', 'sdxl_steps')
+_FORM_FLOAT_FIELDS = ('denoise', 'strength', 'sdxl_saturation', 'sdxl_denoise')
+_FORM_BOOL_FIELDS = ('only_center_face', 'use_hires_fix', 'use_tiling', 'result_url')
+
+def _get_image_request():
+    """
+    Read the body of a single-image route: JSON with a base64 'image', or
+    multipart/form-data with the image as an 'image' file part (no base64
+    inflation or decode) and the other parameters as form fields
+    
+    Returns:
+        params dict with 'image' as base64 str or raw bytes, or None if empty
+    Raises:
+        BadRequestBody if a numeric form field doesn't parse
+    """
+    if request.mimetype == 'multipart/form-data':
+        params = request.form.to_dict()
+        for fields, convert in ((_FORM_INT_FIELDS, int), (_FORM_FLOAT_FIELDS, float)):
+            for key in fields:
+                if key in params:
+                    try:
+                        params[key] = convert(params[key])
+                    except ValueError:
+                        raise BadRequestBody(f"Invalid value for '{key}': {params[key]!r}") from None
+        for key in _FORM_BOOL_FIELDS:
+            if key in params:
+                params[key] = params[key].lower() in ('1', 'true', 'yes')
+        upload = request.files.get('image')
+        if upload:
+            params['image'] = upload.read()
+        return params
+    return _get_json_body()
+
+def _parse_upscale_request():
+    """
+    Read an /upscale or /upscale/binary request body:
+    JSON with a base64 'image', or multipart/form-data with the image as a
+    file part (no base64 inflation, no b64decode)
+    
+    Returns:
+        (params dict, encoded image bytes or None)
+    """
+    if request.mimetype == 'multipart/form-data':
+        form = request.form
+        upload = request.files.get('image')
+        params = {
+            'request_id': form.get('request_id'),
+            'upscaler': form.get('upscaler', 'RealESRGAN x4plus'),
+            'scale_factor': int(form.get('scale_factor', 4)),
+            'use_tiling': form.get('use_tiling', 'true').lower() not in ('0', 'false', 'no'),
+            'result_url': form.get('result_url', 'false').lower() in ('1', 'true', 'yes')
+        }
+        return params, upload.read() if upload else None
+    
+    data = _get_json_body() or {}
+    image_b64 = data.get('image')
+    return data, base64.b64decode(image_b64) if image_b64 else None
+
+def _png_response(png_bytes: bytes, request_id: str, width: int, height: int, processing_time: float):
+    """image/png response with the upscale metadata in headers"""
+    response = Response(png_bytes, mimetype='image/png')
+    response.headers['X-Request-Id'] = request_id
+    response.headers['X-Width'] = str(width)
+    response.headers['X-Height'] = str(height)
+    response.headers['X-Processing-Time'] = str(round(processing_time, 2))
+    return response
+
+# Upscaler names as shown in the UI -> ModelManager keys (unknown names use ESRGAN)
+_UPSCALER_TO_KEY = {
+    'RealESRGAN x4plus': "esrgan",
+    'SwinIR-L 4x': "swinir",
+    'SupResDiffGAN 4x': "supresdiffgan",
+}
+
+def _run_esrgan_batch(key, images):
+    """RequestBatcher callback: one ESRGAN pass over same-sized images"""
+    scale_factor = key[2]
+    
+    def _do_batch():
+        try:
+            engine = manager.get_model("esrgan")
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            _log_exception("upscale model load")
+            raise ModelLoadError(f"Failed to load model: {str(e)}") from e
+        with torch.inference_mode():
+            return engine.upscale_batch(images, scale_factor)
+    
+    if len(images) > 1:
+        print(f"[Upscale] Batching {len(images)} ESRGAN requests ({key[0]}x{key[1]}, {scale_factor}x)")
+    return run_inference_job(_do_batch)
+
+# Small ESRGAN requests (client-side video frames, tiles) arriving together
+# are run as one batch, keyed by (width, height, scale)
+esrgan_batcher = RequestBatcher(_run_esrgan_batch, max_batch=4, max_wait_ms=25, name='esrgan-batch')
+
+def _upscale_to_png(data: dict, request_id: str, image_bytes: bytes):
+    """
+    Shared body of /upscale and /upscale/binary
+    
+    Returns:
+        (png_bytes, width, height, processing_time)
+    Raises:
+        FileNotFoundError if the requested upscaler is not downloaded
+    """
+    scale_factor = data.get('scale_factor', 4)
+    upscaler_name = data.get('upscaler', 'RealESRGAN x4plus')
+    
+    # Map UI name to model key
+    model_key = _UPSCALER_TO_KEY.get(upscaler_name, "esrgan")
         
-        # Map UI name to model key
-        model_key = "esrgan" # default
-        if upscaler_name == 'SwinIR-L 4x':
-            model_key = "swinir"
-        elif upscaler_name == 'SupResDiffGAN 4x':
-            model_key = "supresdiffgan"
-            
+    update_progress(request_id, f"⏳ Queued for {upscaler_name}...", 0)
+    
+    # Decode once, up front - the engine works on the PIL image directly and
+    # the GPU worker doesn't spend its time in the PNG/JPEG decoder
+    input_image = run_codec_job(_decode_image, image_bytes)
+    
+    # Progress callback
+    def progress_cb(progress):
+        step = f"🔧 Upscaling {scale_factor}x [{upscaler_name}]"
+        update_progress(request_id, step, progress)
+    
+    # Small ESRGAN inputs with default tiling fit in one tile anyway, so they
+    # go through the batcher. A batch is one forward pass: progress jumps
+    # from 5 to 100. A timeout raises concurrent.futures.TimeoutError like
+    # run_inference_job (504 in the routes).
+    if (model_key == "esrgan" and manager.device == 'cuda'
+            and data.get('use_tiling', True)
+            and max(input_image.size) <= ESRGANEngine.BATCH_MAX_SIDE):
+        update_progress(request_id, f"🔧 Upscaling {scale_factor}x [{upscaler_name}]", 5)
+        start_time = time.time()
+        key = (input_image.width, input_image.height, scale_factor)
+        output = esrgan_batcher.submit(key, input_image).result(timeout=INFER_TIMEOUT)
+        processing_time = time.time() - start_time
+        png_bytes = run_codec_job(encode_png, output)
+        update_progress(request_id, "✓ Upscale complete!", 100, "complete")
+        return png_bytes, output.width, output.height, processing_time
+    
+    def _do_upscale():
         update_progress(request_id, f"⏳ Loading {upscaler_name}...", 0)
         
         # Get Engine (Lazy Load)
         try:
             active_engine = manager.get_model(model_key)
         except FileNotFoundError:
-             return jsonify({
-                 "error": f"Model {upscaler_name} not found",
-                 "hint": "Please download models via Settings"
-             }), 503
+            raise
         except Exception as e:
-            traceback.print_exc()
-            return jsonify({"error": f"Failed to load model: {str(e)}"}), 500
-
-        # Progress callback
-        def progress_cb(progress):
-            step = f"🔧 Upscaling {scale_factor}x [{upscaler_name}]"
-            update_progress(request_id, step, progress)
+            _log_exception("upscale model load")
+            raise ModelLoadError(f"Failed to load model: {str(e)}") from e
         
         update_progress(request_id, f"🔧 Starting {upscaler_name}...", 5)
         start_time = time.time()
         
-        # Call engine
-        result_base64 = active_engine.upscale_from_base64(
-            base64_image, 
-            scale_factor,
-            use_tiling=data.get('use_tiling', True),
-            progress_callback=progress_cb
-        )
+        with torch.inference_mode():
+            output = active_engine.upscale_to_pil(
+                input_image, 
+                scale_factor,
+                use_tiling=data.get('use_tiling', True),
+                progress_callback=progress_cb
+            )
+        return output, time.time() - start_time
+    
+    # The PNG encode runs on DECODE_POOL, so the GPU worker can start the
+    # next request while this one is being compressed
+    output, processing_time = run_inference_job(_do_upscale)
+    png_bytes = run_codec_job(encode_png, output)
+    
+    update_progress(request_id, "✓ Upscale complete!", 100, "complete")
+    
+    return png_bytes, output.width, output.height, processing_time
+
+@app.route('/upscale', methods=['POST'])
+def upscale_image():
+    """
+    Upscaling endpoint with progress tracking
+    Supports: ESRGAN, SwinIR, SupResDiffGAN
+    
+    Deprecated: returns the image as base64 inside JSON (+33% payload).
+    Prefer /upscale/binary which returns the PNG bytes directly
+    (also returned here when the client sends Accept: image/png).
+    Input: JSON with base64 'image', or multipart/form-data with an 'image' file.
+    """
+    request_id = None
+    try:
+        data, image_bytes = _parse_upscale_request()
+        
+        # Use client-provided ID or generate new one
+        request_id = data.get('request_id') or _new_request_id()
         
-        processing_time = time.time() - start_time
+        if not image_bytes:
+            return ojsonify({"error": "No image data"}), 400
         
-        # Get dimensions
-        input_data = base64.b64decode(base64_image)
-        input_image = Image.open(io.BytesIO(input_data))
-        out_w, out_h = active_engine.get_output_dimensions(
-            input_image.width, input_image.height, scale_factor
-        )
+        try:
+            png_bytes, out_w, out_h, processing_time = _upscale_to_png(data, request_id, image_bytes)
+        except FileNotFoundError:
+            return ojsonify({
+                "error": f"Model {data.get('upscaler', 'RealESRGAN x4plus')} not found",
+                "hint": "Please download models via Settings"
+            }), 503
         
-        update_progress(request_id, "✓ Upscale complete!", 100, "complete")
+        if request.accept_mimetypes.best_match(['application/json', 'image/png']) == 'image/png':
+            return _png_response(png_bytes, request_id, out_w, out_h, processing_time)
         
-        return jsonify({
+        return ojsonify({
             "request_id": request_id,
-            "image": result_base64,
+            **result_image_fields(request_id, png_bytes, bool(data.get('result_url'))),
             "width": out_w,
             "height": out_h,
             "processing_time": round(processing_time, 2)
         })
         
+    except concurrent.futures.TimeoutError:
+        return infer_timeout_response(request_id)
+    except BadRequestBody as e:
+        return ojsonify({"error": str(e), "type": type(e).__name__}), 400
+    except Exception as e:
+        _log_exception()
+        fail_progress(request_id, e)
+        return ojsonify({"error": str(e), "type": type(e).__name__}), 500
+
+@app.route('/upscale/binary', methods=['POST'])
+def upscale_image_binary():
+    """
+    Upscaling endpoint returning the PNG bytes directly (no base64/JSON)
+    Accepts the same body as /upscale (JSON or multipart/form-data).
+    
+    Metadata is sent in response headers:
+        X-Request-Id, X-Width, X-Height, X-Processing-Time
+    """
+    request_id = None
+    try:
+        data, image_bytes = _parse_upscale_request()
+        
+        # Use client-provided ID or generate new one
+        request_id = data.get('request_id') or _new_request_id()
+        
+        if not image_bytes:
+            return ojsonify({"error": "No image data"}), 400
+        
+        try:
+            png_bytes, out_w, out_h, processing_time = _upscale_to_png(data, request_id, image_bytes)
+        except FileNotFoundError:
+            return ojsonify({
+                "error": f"Model {data.get('upscaler', 'RealESRGAN x4plus')} not found",
+                "hint": "Please download models via Settings"
+            }), 503
+        
+        return _png_response(png_bytes, request_id, out_w, out_h, processing_time)
+        
+    except concurrent.futures.TimeoutError:
+        return infer_timeout_response(request_id)
+    except BadRequestBody as e:
+        return ojsonify({"error": str(e), "type": type(e).__name__}), 400
     except Exception as e:
-        traceback.print_exc()
-        return jsonify({"error": str(e), "type": type(e).__name__}), 500
+        _log_exception()
+        fail_progress(request_id, e)
+        return ojsonify({"error": str(e), "type": type(e).__name__}), 500
+
+class EnhanceRequest(msgspec.Struct):
+    """/enhance request body - decoded and validated in one pass"""
+    image: str = ''
+    modules: dict = {}
+    scale_factor: int = 2
+    prompt: str = ''
+    denoising_strength: float = 0.25
+    cfg_scale: float = 7.0
+    use_tiling: bool = True
+    request_id: Optional[str] = None
+    result_url: bool = False
+
+_enhance_decoder = msgspec.json.Decoder(EnhanceRequest)
+
+@app.errorhandler(msgspec.DecodeError)
+def handle_bad_request_body(e):
+    """Malformed JSON or schema mismatch in a msgspec-decoded request body"""
+    return ojsonify({"error": f"Invalid request: {e}", "type": type(e).__name__}, 400)
 
 @app.route('/enhance', methods=['POST'])
 def enhance_image():
     """SDXL img2img enhancement endpoint"""
+    # Decode outside the try: schema errors are 400s (handle_bad_request_body)
+    req = _enhance_decoder.decode(request.get_data(cache=False))
+    request_id = None
     try:
-        data = request.get_json()
-        base64_image = data.get('image')
-        modules = data.get('modules', {})
-        scale_factor = data.get('scale_factor', 2)
-        prompt = data.get('prompt', '')
+        modules = req.modules
+        scale_factor = req.scale_factor
+        prompt = req.prompt
         
-        if not base64_image: return jsonify({"error": "Missing image"}), 400
+        if not req.image: return ojsonify({"error": "Missing image"}), 400
         
         # Use client-provided ID or generate new one
-        request_id = data.get('request_id', str(uuid.uuid4()))
+        request_id = req.request_id or _new_request_id()
         update_progress(request_id, "🎨 Starting Enhancement...", 0)
         
-        # Load SDXL
-        try:
-            sdxl_engine = manager.get_model("sdxl")
-        except Exception as e:
-            return jsonify({"error": f"Failed to load SDXL: {str(e)}"}), 503
-            
+        # Decode up front and drop the base64 string, so it is not held for
+        # the whole SDXL + ESRGAN run next to the images
+        input_image = run_codec_job(SDXLEngine.decode_base64_image, req.image)
+        req.image = ''
+        
         start_time = time.time()
         
         # SDXL Progress Callback
@@ -392,59 +1080,92 @@ def enhance_image():
         def preview_cb(image_b64, step):
             send_preview(request_id, image_b64, step)
         
-        result_base64 = sdxl_engine.enhance_from_base64(
-            base64_image,
-            modules=modules,
-            prompt=prompt,
-            denoising_strength=data.get('denoising_strength', 0.25),
-            cfg_scale=data.get('cfg_scale', 7.0),
-            steps=25,
-            use_tiling=data.get('use_tiling', True),
-            progress_callback=sdxl_progress,
-            preview_callback=preview_cb
-        )
-        
-        sdxl_time = time.time() - start_time
-        
-        # Upscale if requested
-        if modules.get('upscale', False):
-            print(f"Upscaling result with ESRGAN {scale_factor}x...")
-            update_progress(request_id, f"🔍 Upscaling {scale_factor}x...", 80)
-            
-            # Switch to ESRGAN (will unload SDXL)
-            esrgan_engine = manager.get_model("esrgan")
-            
-            def upscale_progress(p):
-                overall = 80 + int(p * 0.2)
-                update_progress(request_id, f"🔍 Upscaling... {p}%", overall)
+        # Results stay PIL Images inside the inference job: SDXL output goes
+        # straight into ESRGAN, and result_image_fields() encodes the final
+        # image on DECODE_POOL once the GPU worker has moved on.
+        upscale_after = modules.get('upscale', False)
+        want_url = req.result_url
+        
+        def upscale_progress(p):
+            overall = 80 + int(p * 0.2)
+            update_progress(request_id, f"🔍 Upscaling... {p}%", overall)
+        
+        def _do_enhance():
+            nonlocal input_image
+            # Load SDXL
+            try:
+                sdxl_engine = manager.get_model("sdxl")
+            except Exception as e:
+                raise ModelLoadError(f"Failed to load SDXL: {str(e)}") from e
+            
+            image, input_image = input_image, None
+            with torch.inference_mode():
+                result = sdxl_engine.enhance_image(
+                    image,
+                    modules=modules,
+                    prompt=prompt,
+                    denoising_strength=req.denoising_strength,
+                    cfg_scale=req.cfg_scale,
+                    steps=25,
+                    use_tiling=req.use_tiling,
+                    progress_callback=sdxl_progress,
+                    preview_callback=preview_cb
+                )
+            del image
+            width, height = result.size
+            sdxl_time = time.time() - start_time
+            
+            # Upscale if requested
+            if upscale_after:
+                print(f"Upscaling result with ESRGAN {scale_factor}x...")
+                update_progress(request_id, f"🔍 Upscaling {scale_factor}x...", 80)
                 
-            result_base64 = esrgan_engine.upscale_from_base64(
-                result_base64, 
-                scale_factor,
-                use_tiling=data.get('use_tiling', True),
-                progress_callback=upscale_progress
-            )
+                # Switch to ESRGAN (SDXL is evicted if VRAM is short). Drop our
+                # reference first, otherwise this frame keeps the SDXL pipeline -
+                # and its VRAM - alive even after the manager unloads it.
+                del sdxl_engine
+                with manager.reserve("sdxl"):
+                    esrgan_engine = manager.get_model("esrgan")
+                with torch.inference_mode():
+                    result = esrgan_engine.upscale_to_pil(
+                        result,
+                        scale_factor,
+                        use_tiling=req.use_tiling,
+                        progress_callback=upscale_progress
+                    )
+                width, height = result.size
+            
+            return result, width, height, sdxl_time
+        
+        try:
+            result, width, height, sdxl_time = run_inference_job(_do_enhance)
+        except ModelLoadError as e:
+            return ojsonify({"error": str(e)}), 503
+        
+        # Enhance calls usually come in a row: if ESRGAN had to evict SDXL,
+        # reload it now instead of at the start of the next request
+        if upscale_after and "sdxl" not in manager.loaded_models:
+            INFER_POOL.submit(manager.preload, "sdxl")
             
         update_progress(request_id, "✓ Complete!", 100, "complete")
         
         processing_time = time.time() - start_time
         
-        # Get dimensions
-        result_data = base64.b64decode(result_base64)
-        result_image = Image.open(io.BytesIO(result_data))
-        
-        return jsonify({
+        return ojsonify({
             "request_id": request_id,
-            "image": result_base64,
-            "width": result_image.width,
-            "height": result_image.height,
+            **result_image_fields(request_id, result, want_url),
+            "width": width,
+            "height": height,
             "processing_time": round(processing_time, 2),
             "sdxl_time": round(sdxl_time, 2)
         })
         
+    except concurrent.futures.TimeoutError:
+        return infer_timeout_response(request_id)
     except Exception as e:
-        traceback.print_exc()
-        return jsonify({"error": str(e), "type": type(e).__name__}), 500
+        _log_exception()
+        fail_progress(request_id, e)
+        return ojsonify({"error": str(e), "type": type(e).__name__}), 500
 
 @app.route('/face-enhance', methods=['POST'])
 def face_enhance():
@@ -452,17 +1173,17 @@ def face_enhance():
     Face Enhancement endpoint using GFPGAN
     Restores and enhances faces in images
     """
+    request_id = None
     try:
-        data = request.json
+        data = _get_image_request()
         if not data or 'image' not in data:
-            return jsonify({"error": "No image provided"}), 400
+            return ojsonify({"error": "No image provided"}), 400
         
         # Decode image
-        image_data = base64.b64decode(data['image'])
-        input_image = Image.open(io.BytesIO(image_data)).convert('RGB')
+        input_image = run_codec_job(_decode_rgb, data.pop('image'))
         
         # Use client-provided ID or generate new one
-        request_id = data.get('request_id', str(uuid.uuid4()))
+        request_id = data.get('request_id') or _new_request_id()
         
         print(f"[Face Enhance] Request {request_id[:8]}")
         
@@ -470,29 +1191,36 @@ def face_enhance():
         
         start_time = time.time()
         
-        try:
+        def progress_cb(p):
+            update_progress(request_id, f"✨ Enhancing faces... {p}%", 10 + int(p * 0.8))
+        
+        def _do_face_enhance():
+            """Returns (engine_available, result_image)"""
             gfpgan_engine = manager.get_model("gfpgan")
-            
             if not gfpgan_engine.is_available():
-                return jsonify({
-                    "error": "GFPGAN not available",
-                    "hint": "Model may not be downloaded yet"
-                }), 503
-            
-            def progress_cb(p):
-                update_progress(request_id, f"✨ Enhancing faces... {p}%", 10 + int(p * 0.8))
+                return False, None
             
             update_progress(request_id, "✨ Enhancing faces...", 20)
             
-            result_image = gfpgan_engine.enhance_face(
-                input_image,
-                upscale=data.get('upscale', 2),
-                only_center_face=data.get('only_center_face', False),
-                progress_callback=progress_cb
-            )
+            with torch.inference_mode():
+                return True, gfpgan_engine.enhance_face(
+                    input_image,
+                    upscale=data.get('upscale', 2),
+                    only_center_face=data.get('only_center_face', False),
+                    progress_callback=progress_cb
+                )
+        
+        try:
+            available, result_image = run_inference_job(_do_face_enhance)
+            
+            if not available:
+                return ojsonify({
+                    "error": "GFPGAN not available",
+                    "hint": "Model may not be downloaded yet"
+                }), 503
             
             if result_image is None:
-                return jsonify({
+                return ojsonify({
                     "error": "Face enhancement failed",
                     "hint": "No faces detected or processing error"
                 }), 500
@@ -500,13 +1228,11 @@ def face_enhance():
             processing_time = time.time() - start_time
             
             # Convert result to base64
-            buffer = io.BytesIO()
-            result_image.save(buffer, format="PNG")
-            result_b64 = base64.b64encode(buffer.getvalue()).decode()
+            result_b64 = run_codec_job(encode_png_base64, result_image)
             
             update_progress(request_id, "✅ Done!", 100, "done")
             
-            return jsonify({
+            return ojsonify({
                 "image": result_b64,
                 "width": result_image.width,
                 "height": result_image.height,
@@ -514,14 +1240,19 @@ def face_enhance():
             })
             
         except FileNotFoundError:
-            return jsonify({
+            return ojsonify({
                 "error": "GFPGAN model not found",
                 "hint": "Please download models first"
             }), 503
             
+    except concurrent.futures.TimeoutError:
+        return infer_timeout_response(request_id)
+    except BadRequestBody as e:
+        return ojsonify({"error": str(e), "type": type(e).__name__}), 400
     except Exception as e:
-        traceback.print_exc()
-        return jsonify({"error": str(e), "type": type(e).__name__}), 500
+        _log_exception()
+        fail_progress(request_id, e)
+        return ojsonify({"error": str(e), "type": type(e).__name__}), 500
 
 
 @app.route('/inpaint', methods=['POST'])
@@ -541,15 +1272,16 @@ def inpaint():
         - width, height
         - processing_time
     """
+    request_id = None
     try:
-        data = request.json
+        data = _get_json_body()
         if not data or 'image' not in data or 'mask' not in data:
-            return jsonify({"error": "Image and mask required"}), 400
+            return ojsonify({"error": "Image and mask required"}), 400
         
         if not data.get('prompt'):
-            return jsonify({"error": "Prompt required"}), 400
+            return ojsonify({"error": "Prompt required"}), 400
         
-        request_id = data.get('request_id', str(uuid.uuid4()))
+        request_id = data.get('request_id') or _new_request_id()
         strength = float(data.get('strength', 0.75))
         
         # Clamp strength
@@ -561,69 +1293,79 @@ def inpaint():
         
         start_time = time.time()
         
-        try:
+        def progress_cb(step, total):
+            pct = 10 + int((step / total) * 80)
+            update_progress(request_id, f"🎨 Inpainting... {step}/{total}", pct)
+        
+        def _do_inpaint():
+            """Returns (engine_available, (result_b64, width, height))"""
             inpaint_engine = manager.get_model("inpaint")
-            
             if not inpaint_engine.is_available():
-                return jsonify({
-                    "error": "SDXL Inpaint not available",
-                    "hint": "diffusers package may not be installed"
-                }), 503
-            
-            def progress_cb(step, total):
-                pct = 10 + int((step / total) * 80)
-                update_progress(request_id, f"🎨 Inpainting... {step}/{total}", pct)
+                return False, None
             
             update_progress(request_id, "🎨 Starting inpainting...", 10)
             
-            result_b64 = inpaint_engine.inpaint_from_base64(
-                image_b64=data['image'],
-                mask_b64=data['mask'],
-                prompt=data['prompt'],
-                strength=strength,
-                progress_callback=progress_cb
-            )
+            with torch.inference_mode():
+                return True, inpaint_engine.inpaint_from_base64(
+                    image_b64=data['image'],
+                    mask_b64=data['mask'],
+                    prompt=data['prompt'],
+                    strength=strength,
+                    progress_callback=progress_cb
+                )
+        
+        try:
+            available, result = run_inference_job(_do_inpaint)
             
-            processing_time = time.time() - start_time
+            if not available:
+                return ojsonify({
+                    "error": "SDXL Inpaint not available",
+                    "hint": "diffusers package may not be installed"
+                }), 503
             
-            # Get result dimensions
-            result_data = base64.b64decode(result_b64)
-            result_image = Image.open(io.BytesIO(result_data))
+            processing_time = time.time() - start_time
+            result_b64, width, height = result
             
             update_progress(request_id, "✅ Inpainting complete!", 100, "done")
             
-            return jsonify({
+            return ojsonify({
                 "image": result_b64,
-                "width": result_image.width,
-                "height": result_image.height,
+                "width": width,
+                "height": height,
                 "processing_time": round(processing_time, 2)
             })
             
+        except concurrent.futures.TimeoutError:
+            return infer_timeout_response(request_id)
         except Exception as e:
-            traceback.print_exc()
-            return jsonify({
+            _log_exception()
+            fail_progress(request_id, e)
+            return ojsonify({
                 "error": f"Inpainting failed: {str(e)}",
                 "type": type(e).__name__
             }), 500
             
+    except BadRequestBody as e:
+        return ojsonify({"error": str(e), "type": type(e).__name__}), 400
     except Exception as e:
-        traceback.print_exc()
-        return jsonify({"error": str(e), "type": type(e).__name__}), 500
+        _log_exception()
+        fail_progress(request_id, e)
+        return ojsonify({"error": str(e), "type": type(e).__name__}), 500
 
 @app.route('/make-real', methods=['POST'])
 def make_real():
     """Make it Real - Convert image using ComfyUI + Qwen Image Edit"""
+    request_id = None
     try:
-        data = request.json
+        data = _get_image_request()
         if not data or 'image' not in data:
-            return jsonify({"error": "No image provided"}), 400
+            return ojsonify({"error": "No image provided"}), 400
 
         # Decode image
-        image_data = base64.b64decode(data['image'])
-        input_image = Image.open(io.BytesIO(image_data)).convert('RGB')
+        input_image = run_codec_job(_decode_rgb, data.pop('image'))
         
         # Use client-provided ID or generate new one
-        request_id = data.get('request_id', str(uuid.uuid4()))
+        request_id = data.get('request_id') or _new_request_id()
         
         # Get prompt (custom or default)
         prompt = data.get('prompt', 'convert to photorealistic, raw photo, dslr quality')
@@ -645,6 +1387,8 @@ def make_real():
         
         update_progress(request_id, "🚀 Starting ComfyUI...", 5)
         
+        want_url = bool(data.get('result_url'))
+        
         # Progress callback for ComfyUI
         def comfyui_progress(progress: int, status: str):
             update_progress(request_id, f"🎨 {status}", progress)
@@ -653,8 +1397,16 @@ def make_real():
         def preview_cb(image_b64: str, step: int):
             send_preview(request_id, image_b64, step)
         
-        # Execute via ComfyUI
-        try:
+        def _do_make_real():
+            """
+            ComfyUI generation + optional ESRGAN upscale
+            Returns (base64_png, width, height), or None if ComfyUI failed.
+            Without an upscale the PIL image is returned in place of the PNG,
+            to be encoded off the GPU worker; with a result URL, PNG bytes.
+            """
+            # ComfyUI is a separate process on the same GPU: give it the VRAM
+            # our resident models (e.g. SDXL preloaded after /enhance) hold
+            manager.unload_all()
             result_image = comfyui_make_it_real(
                 input_image,
                 prompt=prompt,
@@ -670,19 +1422,11 @@ def make_real():
             )
             
             if result_image is None:
-                return jsonify({
-                    "error": "ComfyUI processing failed",
-                    "hint": "Check ComfyUI logs for details"
-                }), 500
-            
-            # Convert result to base64
-            buffer = io.BytesIO()
-            result_image.save(buffer, format="PNG")
-            result_b64 = base64.b64encode(buffer.getvalue()).decode()
+                return None
             
-            # Handle upscaling if requested
+            # Handle upscaling if requested - ESRGAN takes the PIL image as is,
+            # so the result is PNG/base64 encoded exactly once
             scale_factor = data.get('scale_factor', 1)
-            final_b64 = result_b64
             
             if scale_factor > 1:
                 print(f"[Make it Real] Upscaling {scale_factor}x...")
@@ -695,62 +1439,81 @@ def make_real():
                         overall = 85 + int(p * 0.1)
                         update_progress(request_id, f"🔍 Upscaling... {p}%", overall)
                     
-                    final_b64 = esrgan_engine.upscale_from_base64(
-                        result_b64,
-                        scale_factor,
-                        use_tiling=data.get('use_tiling', True),
-                        progress_callback=upscale_progress
-                    )
+                    with torch.inference_mode():
+                        upscaled = esrgan_engine.upscale_to_pil(
+                            result_image,
+                            scale_factor,
+                            use_tiling=data.get('use_tiling', True),
+                            progress_callback=upscale_progress
+                        )
+                    return upscaled, upscaled.width, upscaled.height
                 except Exception as e:
                     print(f"[Make it Real] Upscale failed: {e}, returning non-upscaled result")
-                    final_b64 = result_b64
             
-            update_progress(request_id, "✓ Complete!", 100, "complete")
+            return result_image, result_image.width, result_image.height
+        
+        # Execute via ComfyUI
+        try:
+            result = run_inference_job(_do_make_real)
             
-            # Decode final to get dimensions
-            final_bytes = base64.b64decode(final_b64)
-            final_image = Image.open(io.BytesIO(final_bytes))
+            if result is None:
+                return ojsonify({
+                    "error": "ComfyUI processing failed",
+                    "hint": "Check ComfyUI logs for details"
+                }), 500
+            
+            final_image, width, height = result
+            image_fields = result_image_fields(request_id, final_image, want_url)
+            update_progress(request_id, "✓ Complete!", 100, "complete")
             
-            return jsonify({
+            return ojsonify({
                 "request_id": request_id,
-                "image": final_b64,
+                **image_fields,
                 "prompt": prompt,
-                "width": final_image.width,
-                "height": final_image.height
+                "width": width,
+                "height": height
             })
             
+        except concurrent.futures.TimeoutError:
+            return infer_timeout_response(request_id)
         except Exception as e:
             print(f"[Make it Real] ComfyUI error: {e}")
-            traceback.print_exc()
-            return jsonify({
+            _log_exception()
+            fail_progress(request_id, e)
+            return ojsonify({
                 "error": str(e),
                 "type": type(e).__name__,
                 "hint": "Make sure ComfyUI is properly installed"
             }), 500
 
+    except BadRequestBody as e:
+        return ojsonify({"error": str(e), "type": type(e).__name__}), 400
     except Exception as e:
-        traceback.print_exc()
-        return jsonify({"error": str(e), "type": type(e).__name__}), 500
+        _log_exception()
+        fail_progress(request_id, e)
+        return ojsonify({"error": str(e), "type": type(e).__name__}), 500
 
 @app.route('/sdxl-upscale', methods=['POST'])
 def sdxl_tiled_upscale():
     """SDXL Realistic Advanced Tiled Upscale - 2x enhancement with Tile ControlNet"""
+    request_id = None
     try:
-        data = request.json
+        data = _get_image_request()
         if not data or 'image' not in data:
-            return jsonify({"error": "No image provided"}), 400
+            return ojsonify({"error": "No image provided"}), 400
 
         # Decode image
-        image_data = base64.b64decode(data['image'])
-        input_image = Image.open(io.BytesIO(image_data)).convert('RGB')
+        input_image = run_codec_job(_decode_rgb, data.pop('image'))
         
         # Use client-provided ID or generate new one
-        request_id = data.get('request_id', str(uuid.uuid4()))
+        request_id = data.get('request_id') or _new_request_id()
         
         print(f"[SDXL Upscale] Request {request_id[:8]} - Input size: {input_image.size}")
         
         update_progress(request_id, "🚀 Starting SDXL Tiled Upscale...", 5)
         
+        want_url = bool(data.get('result_url'))
+        
         # Progress callback for ComfyUI
         def comfyui_progress(progress: int, status: str):
             update_progress(request_id, f"🎨 {status}", progress)
@@ -766,8 +1529,10 @@ def sdxl_tiled_upscale():
         sdxl_steps = data.get('sdxl_steps', 8)
         sdxl_denoise = data.get('sdxl_denoise', 0.7)
 
-        # Execute via ComfyUI
+        # Execute via ComfyUI, with our models out of its VRAM (on the GPU
+        # worker, so it runs after any pending load such as the SDXL preload)
         try:
+            run_inference_job(manager.unload_all)
             result_image = comfyui_sdxl_upscale(
                 input_image,
                 scale_factor=scale_factor,
@@ -779,42 +1544,44 @@ def sdxl_tiled_upscale():
             )
             
             if result_image is None:
-                return jsonify({
+                return ojsonify({
                     "error": "SDXL Upscale processing failed",
                     "hint": "Check ComfyUI logs for details"
                 }), 500
             
-            # Convert result to base64
-            buffer = io.BytesIO()
-            result_image.save(buffer, format="PNG")
-            result_b64 = base64.b64encode(buffer.getvalue()).decode()
+            # Encode the result (base64, or stored for /result/<id>)
+            image_fields = result_image_fields(request_id, result_image, want_url)
             
             update_progress(request_id, "✓ Complete!", 100, "complete")
             
-            return jsonify({
+            return ojsonify({
                 "request_id": request_id,
-                "image": result_b64,
+                **image_fields,
                 "width": result_image.width,
                 "height": result_image.height
             })
             
         except Exception as e:
             print(f"[SDXL Upscale] ComfyUI error: {e}")
-            traceback.print_exc()
-            return jsonify({
+            _log_exception()
+            fail_progress(request_id, e)
+            return ojsonify({
                 "error": str(e),
                 "type": type(e).__name__,
                 "hint": "Make sure ComfyUI is properly installed"
             }), 500
 
+    except BadRequestBody as e:
+        return ojsonify({"error": str(e), "type": type(e).__name__}), 400
     except Exception as e:
-        traceback.print_exc()
-        return jsonify({"error": str(e), "type": type(e).__name__}), 500
+        _log_exception()
+        fail_progress(request_id, e)
+        return ojsonify({"error": str(e), "type": type(e).__name__}), 500
 
 @app.route('/system/stats', methods=['GET'])
 def system_stats():
     """Get system stats (VRAM)"""
-    return jsonify(manager.get_status())
+    return ojsonify(manager.get_status())
 
 @app.route('/comfyui/start', methods=['POST'])
 def comfyui_start():
@@ -823,7 +1590,7 @@ def comfyui_start():
         executor = get_executor()
         
         if executor.is_server_running():
-            return jsonify({
+            return ojsonify({
                 "status": "already_running",
                 "message": "ComfyUI is already running"
             })
@@ -832,36 +1599,55 @@ def comfyui_start():
         success = executor.start_server(timeout=120)
         
         if success:
-            return jsonify({
+            return ojsonify({
                 "status": "started",
                 "message": "ComfyUI started successfully"
             })
         else:
-            return jsonify({
+            return ojsonify({
                 "error": "Failed to start ComfyUI",
                 "hint": "Check if ComfyUI is installed correctly"
             }), 500
             
     except Exception as e:
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        _log_exception()
+        return ojsonify({"error": str(e)}), 500
+
+# /comfyui/status is polled by the frontend; reuse a probe this recent
+COMFYUI_STATUS_TTL = 2.0
 
 @app.route('/comfyui/status', methods=['GET'])
 def comfyui_status():
     """Check ComfyUI server status"""
     try:
         executor = get_executor()
-        running = executor.is_server_running()
+        running = executor.is_server_running(max_age=COMFYUI_STATUS_TTL)
         
-        return jsonify({
+        return ojsonify({
             "running": running,
             "url": f"http://127.0.0.1:8188" if running else None
         })
     except Exception as e:
-        return jsonify({"running": False, "error": str(e)})
+        return ojsonify({"running": False, "error": str(e)})
+
+# Cards with less VRAM than this stay fully lazy at startup
+WARMUP_MIN_VRAM = 6 << 30
+
+def _warmup_default_engine():
+    """Load ESRGAN and run a dummy forward pass (runs on INFER_POOL)"""
+    try:
+        start = time.time()
+        engine = manager.get_model("esrgan")
+        with torch.inference_mode():
+            engine.warmup()
+        print(f"[Startup] ESRGAN warmed up in {time.time() - start:.1f}s")
+    except Exception as e:
+        print(f"[Startup] Warning: ESRGAN warmup failed: {e}")
 
 def startup_sequence():
     """Initialize server"""
+    threading.Thread(target=_reap_stores, name='store-reaper', daemon=True).start()
+    
     print("\n" + "="*60)
     print("Upscale Engine CC Backend Server - Startup")
     print("="*60)
@@ -872,17 +1658,43 @@ def startup_sequence():
     else:
         print("\n[OK] All models present (Lazy loading enabled)")
     
+    # Pre-load and warm the default upscaler in the background so the first
+    # /upscale doesn't pay for CUDA kernel loading and cuDNN autotuning.
+    # Set LUMASCALE_NO_WARMUP=1 to keep startup fully lazy.
+    # Bound the caching allocator so this process can't take the whole card
+    # (override with LUMASCALE_VRAM_FRACTION, e.g. 0.8 when sharing the GPU)
+    if manager.device == 'cuda':
+        torch.cuda.set_per_process_memory_fraction(float(os.getenv('LUMASCALE_VRAM_FRACTION', '0.95')))
+    
+    if manager.device == 'cuda' and not os.getenv('LUMASCALE_NO_WARMUP'):
+        torch.backends.cudnn.benchmark = True
+        # Only keep ESRGAN resident from boot on cards with room to spare;
+        # ModelManager evicts it (LRU) when a bigger model needs the VRAM
+        total_vram = torch.cuda.mem_get_info()[1]
+        if total_vram > WARMUP_MIN_VRAM and downloader.check_model_exists("upscale_esrgan"):
+            INFER_POOL.submit(_warmup_default_engine)
+    
     print("\n" + "="*60)
     print("Server ready on http://localhost:5555")
     print("="*60 + "\n")
 
 
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+
+def _save_upload(file_storage, dest: Path):
+    """Copy an uploaded file to dest in 1 MB chunks (bounded memory per upload)"""
+    with open(dest, 'wb') as f:
+        shutil.copyfileobj(file_storage.stream, f, length=UPLOAD_CHUNK_SIZE)
+
+
 @app.route('/video/info', methods=['POST'])
 def video_info():
     """Get video metadata"""
+    request.max_content_length = VIDEO_MAX_CONTENT_LENGTH
     try:
         if 'video' not in request.files:
-            return jsonify({"error": "No video file provided"}), 400
+            return ojsonify({"error": "No video file provided"}), 400
         
         video_file = request.files['video']
         
@@ -890,18 +1702,18 @@ def video_info():
         temp_path = Path(__file__).parent / "temp_video"
         temp_path.mkdir(exist_ok=True)
         temp_file = temp_path / video_file.filename
-        video_file.save(str(temp_file))
+        _save_upload(video_file, temp_file)
         
         try:
             info = get_video_info(str(temp_file))
             if info is None:
-                return jsonify({"error": "Cannot read video"}), 400
-            return jsonify(info)
+                return ojsonify({"error": "Cannot read video"}), 400
+            return ojsonify(info)
         finally:
             temp_file.unlink(missing_ok=True)
             
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return ojsonify({"error": str(e)}), 500
 
 
 @app.route('/video/extract', methods=['POST'])
@@ -917,9 +1729,10 @@ def video_extract_frames():
     Returns:
         JSON with list of extracted frames as base64
     """
+    request.max_content_length = VIDEO_MAX_CONTENT_LENGTH
     try:
         if 'video' not in request.files:
-            return jsonify({"error": "No video file provided"}), 400
+            return ojsonify({"error": "No video file provided"}), 400
         
         video_file = request.files['video']
         interval = float(request.form.get('interval', 1.0))
@@ -931,8 +1744,8 @@ def video_extract_frames():
         # Save video temporarily
         temp_path = Path(__file__).parent / "temp_video"
         temp_path.mkdir(exist_ok=True)
-        temp_file = temp_path / f"extract_{uuid.uuid4().hex[:8]}_{video_file.filename}"
-        video_file.save(str(temp_file))
+        temp_file = temp_path / f"extract_{secrets.token_hex(4)}_{video_file.filename}"
+        _save_upload(video_file, temp_file)
         
         try:
             print(f"[Video] Extracting frames from {video_file.filename}, interval={interval}s, max={max_frames}")
@@ -945,7 +1758,7 @@ def video_extract_frames():
             
             print(f"[Video] Extracted {len(frames)} frames")
             
-            return jsonify({
+            return ojsonify({
                 "frames": frames,
                 "count": len(frames),
                 "interval": interval
@@ -955,14 +1768,31 @@ def video_extract_frames():
             temp_file.unlink(missing_ok=True)
             
     except Exception as e:
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        _log_exception()
+        return ojsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
-    import sys
     skip_deps = '--skip-deps' in sys.argv or '-s' in sys.argv
     
-    startup_sequence()
+    # Werkzeug is a development server - only use it when asked to, or when
+    # neither gunicorn (Linux/macOS) nor waitress (any OS, incl. Windows) is installed.
+    # LUMASCALE_SERVER=gunicorn|waitress|werkzeug pins the choice.
+    server_choice = os.getenv('LUMASCALE_SERVER', '').lower()
+    if os.getenv('LUMASCALE_DEV'):
+        server_choice = 'werkzeug'
+    dev_mode = server_choice == 'werkzeug'
+    has_gunicorn = os.name != 'nt' and importlib.util.find_spec('gunicorn') is not None
+    has_waitress = importlib.util.find_spec('waitress') is not None
+    if server_choice == 'gunicorn' and not has_gunicorn:
+        print("[Startup] LUMASCALE_SERVER=gunicorn but gunicorn is not available on this platform")
+    if server_choice == 'waitress' and not has_waitress:
+        print("[Startup] LUMASCALE_SERVER=waitress but waitress is not installed")
+    use_gunicorn = has_gunicorn and server_choice in ('', 'gunicorn')
+    use_waitress = has_waitress and not use_gunicorn and server_choice in ('', 'waitress', 'gunicorn')
+    
+    # With gunicorn, startup_sequence() runs in the post_fork hook instead
+    if not use_gunicorn:
+        startup_sequence()
     
     # Auto-install ComfyUI and custom nodes if missing (skip with --skip-deps)
     if not skip_deps:
@@ -976,5 +1806,22 @@ if __name__ == '__main__':
 
     # Start the server
     PORT = 5555 # Default port
+    # Request threads: each open SSE stream (progress, preview) holds one
+    # for its lifetime, on top of regular requests and status polling
+    THREADS = int(os.getenv('LUMASCALE_THREADS', '16'))
+    if use_gunicorn:
+        print(f"Starting gunicorn on port {PORT}...")
+        os.chdir(Path(__file__).parent)
+        os.execvp(sys.executable, [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_conf.py', 'server:app'])
+    
+    if use_waitress:
+        from waitress import serve
+        print(f"Starting waitress on port {PORT} ({THREADS} threads)...")
+        # channel_timeout covers long SDXL requests and SSE streams
+        serve(app, host='0.0.0.0', port=PORT, threads=THREADS, channel_timeout=600)
+        sys.exit(0)
+    
+    if not dev_mode:
+        print("[Startup] gunicorn/waitress not available - falling back to the Werkzeug server")
     print(f"Starting server on port {PORT}...")
     app.run(host='0.0.0.0', port=PORT, threaded=True, use_reloader=False)
@@ -93,10 +93,48 @@ export interface ProgressUpdate {
     progress: number;
 }
 
+/**
+ * Subscribe to progress via Server-Sent Events.
+ * Resolves true once the stream delivered updates, false if it failed before
+ * any message arrived (e.g. older backend without the stream endpoint).
+ */
+const streamProgress = (
+    requestId: string,
+    onProgress: (update: ProgressUpdate) => void
+): Promise<boolean> => {
+    return new Promise((resolve) => {
+        const source = new EventSource(`${BACKEND_URL}/progress/${requestId}/stream`);
+        let finished = false;
+
+        source.onmessage = (event) => {
+            const data: ProgressUpdate = JSON.parse(event.data);
+            onProgress(data);
+
+            if (data.status === 'complete' || data.status === 'done' || data.status === 'error' || data.progress >= 100) {
+                finished = true;
+                source.close();
+                resolve(true);
+            }
+        };
+
+        source.onerror = () => {
+            // EventSource auto-reconnects by default - stop instead, the server closes finished streams.
+            // A stream dropped before a terminal status hands over to polling.
+            source.close();
+            resolve(finished);
+        };
+    });
+};
+
 export const pollProgress = async (
     requestId: string,
     onProgress: (update: ProgressUpdate) => void
 ): Promise<void> => {
+    if (typeof EventSource !== 'undefined' && await streamProgress(requestId, onProgress)) {
+        return;
+    }
+
+    // Fallback: poll every 500ms
     return new Promise((resolve) => {
         const interval = setInterval(async () => {
             try {